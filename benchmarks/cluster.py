@@ -0,0 +1,387 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+# Default number of simulated nodes, the head included
+NODE_COUNTS = [1, 8, 32, 128, 256]
+
+# Relative slowdown over the baseline reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+DEFAULT_BASELINES = Path(__file__).parent / "baselines.json"
+
+# Stand-in of docker in the simulated nodes, it accepts any command
+FAKE_DOCKER = """#!/bin/sh
+case "$1" in
+  ps|image|buildx) ;;
+  *) echo "$@" > /dev/null ;;
+esac
+"""
+
+
+class FakeCluster:
+
+    def __init__(self, root: Path, latency: float = 0.0):
+
+        self.root = root
+        self.latency = latency
+        self.connections = 0
+        self.port = None
+
+        self._loop = asyncio.new_event_loop()
+        self._key = asyncssh.generate_private_key("ssh-ed25519")
+
+    def start(self, ips: List[str]) -> None:
+
+        fake = self
+
+        class Server(asyncssh.SSHServer):
+
+            def connection_made(self, conn):
+                fake.connections += 1
+
+            async def begin_auth(self, username):
+                # A handshake costs a few round trips
+                await asyncio.sleep(2 * fake.latency)
+                return False
+
+        class SFTPServer(asyncssh.SFTPServer):
+
+            def __init__(self, chan):
+                super().__init__(chan, chroot=fake.home(chan.get_extra_info("sockname")[0]))
+
+        async def handle(process):
+
+            await asyncio.sleep(fake.latency)
+
+            home = fake.home(process.get_extra_info("sockname")[0])
+
+            result = await asyncio.get_event_loop().run_in_executor(
+                None, lambda: subprocess.run(process.command or "true",
+                                             shell=True,
+                                             cwd=home,
+                                             capture_output=True))
+
+            process.stdout.write(result.stdout.decode())
+            process.stderr.write(result.stderr.decode())
+            process.exit(result.returncode)
+
+        async def create_server():
+
+            for _ in range(10):
+
+                port = random.randint(20000, 60000)
+                servers = []
+
+                # Listen only on loopback addresses, one for every simulated node
+                try:
+                    for ip in ips:
+                        servers.append(await asyncssh.create_server(
+                            Server, ip, port,
+                            server_host_keys=[self._key],
+                            process_factory=handle,
+                            sftp_factory=SFTPServer,
+                            backlog=1024))
+                except OSError:
+                    for server in servers:
+                        server.close()
+                    continue
+
+                return port
+
+            raise RuntimeError("Failed to find a free port")
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+
+        self.port = asyncio.run_coroutine_threadsafe(create_server(), self._loop).result()
+
+    def home(self, ip: str) -> str:
+
+        # Every simulated node has its own home directory
+        home = self.root / "remote" / ip
+        home.mkdir(parents=True, exist_ok=True)
+
+        return str(home)
+
+    def configure_client(self) -> Path:
+
+        (self.root / "remote").mkdir(parents=True, exist_ok=True)
+        (self.root / "bin").mkdir(parents=True, exist_ok=True)
+        (self.root / "home" / ".ssh").mkdir(parents=True, exist_ok=True)
+
+        (self.root / "home" / ".ssh" / "config").write_text(
+            f"Host 127.*\n  Port {self.port}\n")
+
+        docker = self.root / "bin" / "docker"
+        docker.write_text(FAKE_DOCKER)
+        docker.chmod(0o755)
+
+        key = self.root / "home" / ".ssh" / "id_ed25519"
+        asyncssh.generate_private_key("ssh-ed25519").write_private_key(str(key))
+
+        os.environ["HOME"] = str(self.root / "home")
+        os.environ["XDG_CACHE_HOME"] = str(self.root / "cache")
+        os.environ["PATH"] = f"{self.root / 'bin'}:{os.environ['PATH']}"
+
+        return key
+
+
+def node_ips(nodes: int) -> List[str]:
+
+    return ["127.0.0.1"] + [f"127.0.{i // 250}.{i % 250 + 2}" for i in range(nodes - 1)]
+
+
+def make_project(root: Path, nodes: int, key: Path) -> Path:
+
+    from clusterize import structures
+
+    cluster = structures.cluster.Cluster(cluster_name="bench")
+    cluster.auth.ssh_user = "bench"
+    cluster.auth.ssh_private_key = str(key)
+    cluster.provider.head_ip = node_ips(nodes=nodes)[0]
+    cluster.provider.worker_ips = node_ips(nodes=nodes)[1:]
+    cluster.docker = structures.cluster.Docker(image="bench:latest",
+                                               head_run_options=[],
+                                               worker_run_options=[])
+    cluster.initialization_commands = ["true"]
+    cluster.setup_commands = ["echo setup"]
+    cluster.head_start_ray_commands = ["ray start --head"]
+    cluster.worker_start_ray_commands = ["ray start --address=$RAY_HEAD_IP:6379"]
+
+    project_dir = root / f"project_{nodes}"
+    project_dir.mkdir(parents=True, exist_ok=True)
+
+    (project_dir / ".clusterize").touch()
+    (project_dir / "cluster.yaml").write_text(cluster.to_yaml())
+    (project_dir / "project.yaml").write_text("name: bench\n")
+
+    return project_dir
+
+
+def timed(function: Callable[[], None]) -> float:
+
+    started = time.perf_counter()
+
+    # The output of the nodes would dominate the measurements
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+
+    return time.perf_counter() - started
+
+
+def fresh_connections() -> None:
+
+    from clusterize.executors import ssh
+
+    # Every CLI invocation starts without open connections
+    ssh.connection_pool.close()
+
+
+def bench_start(project_dir: Path) -> Dict[str, float]:
+
+    from clusterize import utils
+    from clusterize.commands.cluster import start
+
+    cluster = utils.project.get_project_config(project_folder=str(project_dir)).cluster
+    cluster = utils.docker.dockerize_cluster(cluster=cluster, session="bench")
+
+    phases = {
+        "deploy_cluster_resources": lambda: start.deploy_cluster_resources(cluster=cluster),
+        "initialize": lambda: start.initialize(cluster=cluster),
+        "setup": lambda: start.setup(cluster=cluster),
+        "head_setup": lambda: start.head_setup(cluster=cluster),
+        "worker_setup": lambda: start.worker_setup(cluster=cluster),
+        "head_start_ray": lambda: start.head_start_ray(cluster=cluster),
+        "worker_start_ray": lambda: start.worker_start_ray(cluster=cluster),
+    }
+
+    return {name: timed(function=phase) for name, phase in phases.items()}
+
+
+def bench_execute(project_dir: Path) -> Dict[str, float]:
+
+    from clusterize.commands.cluster import execute
+
+    args = argparse.Namespace(project_dir=str(project_dir), command="hostname", args=[],
+                              on="CLUSTER", session=None, docker=False, timeout=None,
+                              deadline=None, retries=0, output_dir=None, trace=None)
+
+    return {"execute": timed(function=lambda: execute.execute(args))}
+
+
+def bench_topology(project_dir: Path) -> Dict[str, float]:
+
+    from clusterize import utils
+    from clusterize.commands.cluster import topology
+
+    cluster = utils.project.get_project_config(project_folder=str(project_dir)).cluster
+
+    return {"probe": timed(function=lambda: topology.get_extra_nodes_info(
+        cluster=cluster, project_dir=str(project_dir), refresh=True))}
+
+
+def bench_stop(project_dir: Path) -> Dict[str, float]:
+
+    from clusterize import utils
+    from clusterize.commands.cluster import stop
+
+    cluster = utils.project.get_project_config(project_folder=str(project_dir)).cluster
+
+    return {"stop": timed(function=lambda: stop.stop_cluster_with_docker(
+        cluster=cluster, session="bench"))}
+
+
+SCENARIOS = {
+    "start": bench_start,
+    "execute": bench_execute,
+    "topology": bench_topology,
+    "stop": bench_stop,
+}
+
+
+def run_benchmarks(fake: FakeCluster,
+                   key: Path,
+                   node_counts: List[int],
+                   scenarios: List[str]) -> Dict[str, Dict[str, Dict]]:
+
+    results = {}
+
+    for nodes in node_counts:
+
+        project_dir = make_project(root=fake.root, nodes=nodes, key=key)
+
+        for scenario in scenarios:
+
+            fresh_connections()
+            fake.connections = 0
+
+            phases = SCENARIOS[scenario](project_dir=project_dir)
+
+            results.setdefault(scenario, {})[str(nodes)] = dict(
+                wall=sum(phases.values()),
+                phases=phases,
+                connections=fake.connections)
+
+            print(f"{scenario:<10} nodes={nodes:<5} wall={sum(phases.values()):8.3f}s "
+                  f"connections={fake.connections}")
+
+    return results
+
+
+def compare(results: Dict, baselines: Dict, tolerance: float) -> List[str]:
+
+    regressions = []
+
+    for scenario, by_nodes in results.items():
+        for nodes, result in by_nodes.items():
+
+            baseline = baselines.get(scenario, {}).get(nodes, None)
+
+            if baseline is None:
+                continue
+
+            if result["wall"] > baseline["wall"] * (1 + tolerance):
+                regressions.append(f"{scenario} with {nodes} nodes: {result['wall']:.3f}s "
+                                   f"(baseline {baseline['wall']:.3f}s)")
+
+            if result["connections"] > baseline["connections"]:
+                regressions.append(f"{scenario} with {nodes} nodes: "
+                                   f"{result['connections']} connections "
+                                   f"(baseline {baseline['connections']})")
+
+    return regressions
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(
+        description="Measure the latency of the cluster commands against simulated "
+                    "nodes served by a local SSH server.")
+
+    parser.add_argument(
+        "--nodes", metavar="N", type=int, nargs="+", default=NODE_COUNTS,
+        help="Numbers of nodes to simulate (default: %(default)s)")
+
+    parser.add_argument(
+        "--scenarios", metavar="NAME", nargs="+", choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+        help="Commands to measure (default: %(default)s)")
+
+    parser.add_argument(
+        "--latency", metavar="SECONDS", type=float, default=0.0,
+        help="Latency injected in every handshake and command (default: %(default)s)")
+
+    parser.add_argument(
+        "--output", metavar="FILE", type=str, default=None,
+        help="Store the results as json")
+
+    parser.add_argument(
+        "--baselines", metavar="FILE", type=str, default=str(DEFAULT_BASELINES),
+        help="Results to compare with (default: %(default)s)")
+
+    parser.add_argument(
+        "--save-baselines", action="store_true", default=False,
+        help="Store the results as the new baselines")
+
+    parser.add_argument(
+        "--tolerance", metavar="FRACTION", type=float, default=DEFAULT_TOLERANCE,
+        help="Slowdown over the baselines reported as a regression "
+             "(default: %(default)s)")
+
+    args = parser.parse_args()
+
+    if asyncssh is None:
+        raise RuntimeError("The benchmarks require the 'asyncssh' package")
+
+    with tempfile.TemporaryDirectory(prefix="clusterize_bench") as root:
+
+        fake = FakeCluster(root=Path(root), latency=args.latency)
+        fake.start(ips=node_ips(nodes=max(args.nodes)))
+        key = fake.configure_client()
+
+        results = run_benchmarks(fake=fake, key=key, node_counts=args.nodes,
+                                 scenarios=args.scenarios)
+
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.save_baselines:
+        Path(args.baselines).write_text(json.dumps(results, indent=2))
+        return
+
+    if not Path(args.baselines).is_file():
+        print(f"No baselines found in '{args.baselines}'")
+        return
+
+    regressions = compare(results=results,
+                          baselines=json.loads(Path(args.baselines).read_text()),
+                          tolerance=args.tolerance)
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    sys.exit(1 if len(regressions) != 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from typing import List
+
+# Command lines that must not pay the import of the heavy dependencies
+COMMAND_LINES = [
+    ["--help"],
+    ["cluster", "--help"],
+    ["project", "--help"],
+    ["project", "list"],
+]
+
+LAUNCHER = "import sys; from clusterize.__main__ import main; " \
+           "sys.argv[0] = 'clusterize'; main()"
+
+
+def timed(cmd: List[str]) -> float:
+
+    started = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - started
+
+    # A command line that fails early would look fast
+    if result.returncode != 0:
+        raise RuntimeError(f"Command '{' '.join(cmd)}' failed "
+                           f"(exit={result.returncode}): "
+                           f"{result.stderr.decode(errors='replace').strip()}")
+
+    return elapsed
+
+
+def measure(cmd: List[str], repetitions: int) -> float:
+
+    return statistics.median(timed(cmd=cmd) for _ in range(repetitions))
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Measure the startup time of the CLI.")
+
+    parser.add_argument(
+        "--repetitions", metavar="N", type=int, default=10,
+        help="Number of runs of every command line (default: %(default)s)")
+
+    parser.add_argument(
+        "--budget", metavar="SECONDS", type=float, default=0.1,
+        help="Maximum median startup time on top of the bare interpreter "
+             "(default: %(default)s)")
+
+    args = parser.parse_args()
+
+    # The startup of the bare interpreter is not under our control
+    interpreter = measure(cmd=[sys.executable, "-c", "pass"],
+                          repetitions=args.repetitions)
+    print(f"{'python -c pass':<30} {interpreter * 1000:8.1f} ms")
+
+    exceeded = False
+
+    for argv in COMMAND_LINES:
+
+        overhead = measure(cmd=[sys.executable, "-c", LAUNCHER] + argv,
+                           repetitions=args.repetitions) - interpreter
+        exceeded |= overhead > args.budget
+
+        print(f"{'clusterize ' + ' '.join(argv):<30} {overhead * 1000:8.1f} ms "
+              f"{'(over budget)' if overhead > args.budget else ''}")
+
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == "__main__":
+    main()
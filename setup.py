@@ -10,7 +10,7 @@ setup(
     url="https://github.com/diegoferigo/clusterize",
     license="LGPL",
     platforms='any',
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     keywords="cluster distributed ssh docker rl ml",
     classifiers=[
         "Development Status :: 4 - Beta",
@@ -37,6 +37,9 @@ setup(
         "tree-format",
         "dataclasses",
     ],
+    extras_require={
+        "asyncio": ["asyncssh"],
+    },
     entry_points={
         "console_scripts": [
             "clusterize=clusterize.__main__:main",
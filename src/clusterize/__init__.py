@@ -1,3 +1,4 @@
-from . import cli
-from . import executors
-from . import structures
+from .lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["cli", "executors", "structures", "utils",
+                                         "commands", "daemon"])
@@ -1,6 +1,19 @@
+import sys
 from . import cli
 
 
 def main():
+
+    # Interactive commands are served by the daemon of the project, if running.
+    # The client is imported only when it could be used, to keep the startup of
+    # the other commands fast.
+    if len(sys.argv) > 3 and sys.argv[1] in ("cluster", "session"):
+
+        from . import daemon
+        code = daemon.forward(argv=sys.argv)
+
+        if code is not None:
+            sys.exit(code)
+
     parser = cli.CmdLineParser()
     parser.parse()
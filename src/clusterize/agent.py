@@ -0,0 +1,194 @@
+import io
+import os
+import sys
+import json
+import base64
+import codecs
+import signal
+import threading
+import subprocess
+
+# The agent runs in the nodes with their system python, it must depend only on
+# the standard library and it must not import clusterize
+
+VERSION = 1
+
+READ_SIZE = 64 * 1024
+
+
+class Agent:
+
+    def __init__(self, stdin, stdout):
+
+        self._stdin = stdin
+        self._stdout = stdout
+        self._lock = threading.Lock()
+
+        # Running commands by request, stopped when the client goes away
+        self._processes = {}
+        self._processes_lock = threading.Lock()
+
+    def send(self, **frame) -> None:
+
+        line = json.dumps(frame) + "\n"
+
+        # Frames of concurrent requests must not get mixed
+        with self._lock:
+            self._stdout.write(line)
+            self._stdout.flush()
+
+    def serve(self) -> None:
+
+        self.send(agent=VERSION, pid=os.getpid())
+
+        for line in self._stdin:
+
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.send(id=None, error=f"Invalid request: {e}")
+                continue
+
+            if not isinstance(message, dict):
+                self.send(id=None, error=f"Invalid request: {line.strip()!r}")
+                continue
+
+            op = message.get("op", None)
+
+            if op == "exit":
+                break
+
+            handler = getattr(self, "_op_" + str(op), None)
+
+            if handler is None:
+                self.send(id=message.get("id", None), error=f"Unknown operation '{op}'")
+                continue
+
+            # Commands can be long, all the operations are served concurrently
+            threading.Thread(target=self._handle, args=(handler, message),
+                             daemon=True).start()
+
+        # Nobody is left to read the output of the commands still running
+        with self._processes_lock:
+            for process in self._processes.values():
+                self._kill(process=process)
+
+    def _handle(self, handler, message: dict) -> None:
+
+        try:
+            handler(message)
+        except Exception as e:
+            self.send(id=message["id"], error=f"{type(e).__name__}: {e}")
+
+    def _stream(self, request_id: int, name: str, stream) -> None:
+
+        # Chunks could split multi-byte characters
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        while True:
+
+            data = os.read(stream.fileno(), READ_SIZE)
+
+            if len(data) == 0:
+                break
+
+            self.send(id=request_id, stream=name, data=decoder.decode(data))
+
+        tail = decoder.decode(b"", final=True)
+
+        if tail != "":
+            self.send(id=request_id, stream=name, data=tail)
+
+        stream.close()
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _op_run(self, message: dict) -> None:
+
+        # Like the ssh exec of the other executors, use the login shell of the user
+        process = subprocess.Popen([os.environ.get("SHELL", "/bin/sh"), "-c",
+                                    message["cmd"]],
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   start_new_session=True)
+
+        with self._processes_lock:
+            self._processes[message["id"]] = process
+
+        readers = [threading.Thread(target=self._stream,
+                                    args=(message["id"], name, stream))
+                   for name, stream in (("out", process.stdout), ("err", process.stderr))]
+
+        for reader in readers:
+            reader.start()
+
+        timed_out = False
+
+        try:
+            process.wait(timeout=message.get("timeout", None))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self._kill(process=process)
+            process.wait()
+
+        for reader in readers:
+            reader.join()
+
+        with self._processes_lock:
+            self._processes.pop(message["id"], None)
+
+        self.send(id=message["id"], exit=process.returncode, timed_out=timed_out)
+
+    def _op_kill(self, message: dict) -> None:
+
+        with self._processes_lock:
+            process = self._processes.get(message["target"], None)
+
+        if process is not None:
+            self._kill(process=process)
+
+        self.send(id=message["id"], result=dict(killed=process is not None))
+
+    def _op_put(self, message: dict) -> None:
+
+        path = os.path.expanduser(message["path"])
+
+        if message["offset"] == 0:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path, "r+b" if message["offset"] != 0 else "wb") as f:
+            f.seek(message["offset"])
+            f.write(base64.b64decode(message["data"]))
+
+        if message.get("mode", None) is not None:
+            os.chmod(path, message["mode"])
+
+        self.send(id=message["id"], result=dict(size=os.path.getsize(path)))
+
+    def _op_stats(self, message: dict) -> None:
+
+        meminfo = {}
+
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                meminfo[key] = int(value.split()[0]) * 1024
+
+        self.send(id=message["id"], result=dict(
+            cpus=os.cpu_count(),
+            load=os.getloadavg(),
+            mem_total=meminfo.get("MemTotal", 0),
+            mem_available=meminfo.get("MemAvailable", 0)))
+
+
+if __name__ == "__main__":
+    # Undecodable bytes must reach the json decoder to get an error frame
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    Agent(stdin=stdin, stdout=sys.stdout).serve()
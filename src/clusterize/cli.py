@@ -1,8 +1,6 @@
 import os
 import sys
-import inspect
 import argparse
-import netifaces
 from . import commands
 from pathlib import Path
 from typing import Tuple, NamedTuple, List
@@ -17,7 +15,7 @@ class ClusterCmdLine:
             description="Cluster manager.",
             prog=os.path.basename(sys.argv[0]) + " " + sys.argv[1])
 
-        choices = ["start", "stop", "topology", "execute"]
+        choices = ["start", "stop", "topology", "execute", "sync"]
         cluster_parser.add_argument("subcommand", type=str, choices=choices, help="")
 
         args, _ = cluster_parser.parse_known_args(sys.argv[2:3])
@@ -44,6 +42,73 @@ class ClusterCmdLine:
             "--session", metavar="NAME",
             help="A name to tag the session with (default: the project name)")
 
+        start_parser.add_argument(
+            "--cpus", metavar="N", type=int, default=None,
+            help="Start only in the least loaded workers with N free CPUs, reserving "
+                 "them for the session")
+
+        start_parser.add_argument(
+            "--gpus", metavar="N", type=int, default=None,
+            help="Start only in the least loaded workers with N free GPUs, reserving "
+                 "them for the session")
+
+        start_parser.add_argument(
+            "--workers", metavar="N", type=int, default=None,
+            help="Number of workers to select with --cpus / --gpus "
+                 "(default: all the workers with enough free resources)")
+
+        start_parser.add_argument(
+            "--resume", action="store_true", default=False,
+            help="Continue a previous start skipping the phases that already "
+                 "completed in each node")
+
+        start_parser.add_argument(
+            "--max-transfers", metavar="N", type=int, default=16,
+            help="Maximum number of concurrent file transfers (default: %(default)s)")
+
+        start_parser.add_argument(
+            "--tree-transfer", action="store_true", default=False,
+            help="Upload the cluster resources only to the head node, which then "
+                 "forwards them to the workers")
+
+        start_parser.add_argument(
+            "--distribute-image", action="store_true", default=False,
+            help="Pull the docker image only in the head node, which then streams it "
+                 "to the workers")
+
+        start_parser.add_argument(
+            "--image-fanout", metavar="N", type=int, default=1,
+            help="Number of nodes that every node holding the image feeds in parallel "
+                 "during the distribution (default: %(default)s)")
+
+        start_parser.add_argument(
+            "--pipeline", action="store_true", default=False,
+            help="Let every node progress through the start phases independently "
+                 "instead of waiting for all the nodes at the end of each phase")
+
+        start_parser.add_argument(
+            "--batch", action="store_true", default=False,
+            help="Send the commands of each phase to the nodes as a single script")
+
+        start_parser.add_argument(
+            "--timeout", metavar="SECONDS", type=float, default=None,
+            help="Maximum duration of every command in a node (default: no timeout)")
+
+        start_parser.add_argument(
+            "--phase-deadline", metavar="SECONDS", type=float, default=None,
+            help="Maximum duration of every start phase including retries "
+                 "(default: no deadline)")
+
+        start_parser.add_argument(
+            "--retries", metavar="N", type=int, default=0,
+            help="Retry the commands only in the nodes where they failed or timed out "
+                 "(default: %(default)s)")
+
+        start_parser.add_argument(
+            "--trace", metavar="FILE", type=str, default=None,
+            help="Store the timings of every phase, connection, command and transfer "
+                 "as a Chrome trace (chrome://tracing, Perfetto)")
+
         args, extra = start_parser.parse_known_args(sys.argv[3:])
         commands.cluster.start.start(args)
 
@@ -63,6 +128,17 @@ class ClusterCmdLine:
             help="The tag of the active session. If not passed all the project's "
                  "sessions are stopped.")
 
+        stop_parser.add_argument(
+            "--grace", metavar="SECONDS", type=float, default=10.0,
+            help="Time given to the containers to stop before being killed "
+                 "(default: %(default)s)")
+
+        stop_parser.add_argument(
+            "--deadline", metavar="SECONDS", type=float, default=None,
+            help="Maximum duration of the stop in every node, including the time "
+                 "to kill the containers that did not stop (default: grace period "
+                 "plus 10 seconds)")
+
         args, extra = stop_parser.parse_known_args(sys.argv[3:])
         commands.cluster.stop.stop(args)
 
@@ -82,9 +158,42 @@ class ClusterCmdLine:
             help="Gather extra information from the nodes "
                  "(by connecting to the nodes)")
 
+        commands_parser.add_argument(
+            "--refresh", action="store_true", default=False,
+            help="Ignore the cached node information and probe all the nodes again")
+
+        commands_parser.add_argument(
+            "--check-boot", action="store_true", default=False,
+            help="Probe again the cached nodes that rebooted since they were cached")
+
         args, extra = commands_parser.parse_known_args(sys.argv[3:])
         commands.cluster.topology.topology(args)
 
+    @staticmethod
+    def _cluster_sync():
+
+        sync_parser = argparse.ArgumentParser(
+            description="Push the file mounts of the project to all the nodes, sending "
+                        "only the files changed since the previous sync.",
+            prog=os.path.basename(sys.argv[0]) + " " + " ".join(sys.argv[1:3]))
+
+        sync_parser.add_argument(
+            "project_dir", metavar="DIR", type=str,
+            help="The directory of the project")
+
+        sync_parser.add_argument(
+            "--max-transfers", metavar="N", type=int, default=16,
+            help="Maximum number of nodes receiving files at the same time "
+                 "(default: %(default)s)")
+
+        sync_parser.add_argument(
+            "--trace", metavar="FILE", type=str, default=None,
+            help="Store the timings of every connection, command and transfer as a "
+                 "Chrome trace (chrome://tracing, Perfetto)")
+
+        args, extra = sync_parser.parse_known_args(sys.argv[3:])
+        commands.cluster.sync.sync(args)
+
     @staticmethod
     def _cluster_execute():
 
@@ -120,6 +229,30 @@ class ClusterCmdLine:
             help="Execute the command in the docker containers if the cluster has docker "
                  "support")
 
+        execute_parser.add_argument(
+            "--timeout", metavar="SECONDS", type=float, default=None,
+            help="Stop waiting for the command on a node after this time "
+                 "(default: no timeout)")
+
+        execute_parser.add_argument(
+            "--deadline", metavar="SECONDS", type=float, default=None,
+            help="Maximum time spent on the command including retries "
+                 "(default: no deadline)")
+
+        execute_parser.add_argument(
+            "--retries", metavar="N", type=int, default=0,
+            help="Retry the command only in the nodes where it failed or timed out "
+                 "(default: %(default)s)")
+
+        execute_parser.add_argument(
+            "--output-dir", metavar="DIR", type=str, default=None,
+            help="Also store the output of every node in DIR/<node>.log")
+
+        execute_parser.add_argument(
+            "--trace", metavar="FILE", type=str, default=None,
+            help="Store the timings of every connection and command as a Chrome "
+                 "trace (chrome://tracing, Perfetto)")
+
         args, extra = execute_parser.parse_known_args(sys.argv[3:])
         commands.cluster.execute.execute(args)
 
@@ -155,6 +288,9 @@ class ProjectCmdLine:
             "project_name", metavar="NAME", type=str,
             help='The name of the project')
 
+        # Imported here since it is needed only to create projects
+        import netifaces
+
         # From https://stackoverflow.com/a/55613158/12150968
         interface = netifaces.gateways()['default'][netifaces.AF_INET][1]
         default_ip = netifaces.ifaddresses(interface)[netifaces.AF_INET][0]['addr']
@@ -177,6 +313,15 @@ class ProjectCmdLine:
             default=Path().cwd().expanduser().absolute(),
             help="The directory containing the projects to list (default: pwd)")
 
+        list_parser.add_argument(
+            "--recursive", action="store_true", default=False,
+            help="Search the projects also in the subdirectories")
+
+        list_parser.add_argument(
+            "--jobs", metavar="N", type=int, default=1,
+            help="Number of processes parsing the projects not yet indexed "
+                 "(default: %(default)s)")
+
         args, extra = list_parser.parse_known_args(sys.argv[3:])
         commands.project.listprj.listprj(args)
 
@@ -249,11 +394,91 @@ class SessionCmdLine:
             "project_dir", metavar="DIR", type=str,
             help="The directory of the project")
 
+        list_parser.add_argument(
+            "--watch", metavar="SECONDS", type=float, nargs="?", const=2.0, default=None,
+            help="Refresh the sessions periodically (default period: 2 seconds)")
+
         args, extra = list_parser.parse_known_args(sys.argv[3:])
         commands.session.listsess.listsess(args)
 
 
-class CmdLineParser(ClusterCmdLine, ProjectCmdLine, SessionCmdLine):
+class DaemonCmdLine:
+
+    @classmethod
+    def daemon(cls):
+        daemon_parser = argparse.ArgumentParser(
+            description="Daemon keeping the configuration and the connections of a "
+                        "project warm for the interactive commands.",
+            prog=os.path.basename(sys.argv[0]) + " " + sys.argv[1])
+
+        choices = ["start", "stop", "status"]
+        daemon_parser.add_argument("subcommand", type=str, choices=choices, help="")
+
+        args, _ = daemon_parser.parse_known_args(sys.argv[2:3])
+
+        if not hasattr(cls, "_daemon_" + args.subcommand):
+            print(f"Unrecognized command '{args.command}'\n")
+            daemon_parser.print_help()
+            exit(1)
+
+        return getattr(cls, "_daemon_" + args.subcommand)()
+
+    @staticmethod
+    def _daemon_start():
+
+        from . import daemon
+
+        start_parser = argparse.ArgumentParser(
+            description="Start the daemon of a project. While running, cluster execute, "
+                        "cluster topology and session list are served by it.",
+            prog=os.path.basename(sys.argv[0]) + " " + " ".join(sys.argv[1:3]))
+
+        start_parser.add_argument(
+            "project_dir", metavar="DIR", type=str,
+            help="The directory of the project")
+
+        start_parser.add_argument(
+            "--idle-timeout", metavar="SECONDS", type=float,
+            default=daemon.DEFAULT_IDLE_TIMEOUT,
+            help="Stop the daemon after SECONDS without requests (default: %(default)s)")
+
+        start_parser.add_argument(
+            "--foreground", action="store_true", default=False,
+            help="Do not detach the daemon from the terminal")
+
+        args, extra = start_parser.parse_known_args(sys.argv[3:])
+        commands.daemon.control.start(args)
+
+    @staticmethod
+    def _daemon_stop():
+
+        stop_parser = argparse.ArgumentParser(
+            description="Stop the daemon of a project.",
+            prog=os.path.basename(sys.argv[0]) + " " + " ".join(sys.argv[1:3]))
+
+        stop_parser.add_argument(
+            "project_dir", metavar="DIR", type=str,
+            help="The directory of the project")
+
+        args, extra = stop_parser.parse_known_args(sys.argv[3:])
+        commands.daemon.control.stop(args)
+
+    @staticmethod
+    def _daemon_status():
+
+        status_parser = argparse.ArgumentParser(
+            description="Show whether the daemon of a project is running.",
+            prog=os.path.basename(sys.argv[0]) + " " + " ".join(sys.argv[1:3]))
+
+        status_parser.add_argument(
+            "project_dir", metavar="DIR", type=str,
+            help="The directory of the project")
+
+        args, extra = status_parser.parse_known_args(sys.argv[3:])
+        commands.daemon.control.status(args)
+
+
+class CmdLineParser(ClusterCmdLine, ProjectCmdLine, SessionCmdLine, DaemonCmdLine):
 
     def __init__(self):
 
@@ -262,7 +487,7 @@ class CmdLineParser(ClusterCmdLine, ProjectCmdLine, SessionCmdLine):
             description="Manage Ray cluster experiments.")
 
         # Configure the accepted commands
-        choices = ["cluster", "project", "session"]
+        choices = ["cluster", "project", "session", "daemon"]
         self.parser.add_argument("command", type=str, choices=choices, help="")
 
     def parse(self) -> Tuple[NamedTuple, List[str]]:
@@ -1,3 +1,3 @@
-from . import cluster
-from . import project
-from . import session
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["cluster", "daemon", "project", "session"])
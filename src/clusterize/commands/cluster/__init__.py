@@ -1,4 +1,3 @@
-from . import stop
-from . import start
-from . import execute
-from . import topology
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["stop", "start", "execute", "topology", "sync"])
@@ -1,17 +1,17 @@
 from argparse import Namespace
-from clusterize.executors import ssh
+from clusterize.executors import backends, base, output
 from clusterize import structures, utils
 
 
-def execute(args: Namespace) -> None:
+def execute_command(args: Namespace) -> None:
 
-    project_data = utils.project.get_project_data(args.project_dir)
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
 
-    if project_data is None:
-        raise RuntimeError(f"No project found in '{project_data.directory}'")
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
 
-    with open(file=project_data.cluster, mode='r') as f:
-        cls: structures.cluster.Cluster = structures.cluster.Cluster.from_yaml(data=f)
+    project_data = project_config.data
+    cls: structures.cluster.Cluster = project_config.cluster
 
     if args.session is None:
         args.session = project_data.name
@@ -22,17 +22,29 @@ def execute(args: Namespace) -> None:
         cname = utils.docker.get_container_name(cluster=cls, session=args.session)
         command = utils.docker.wrap_in_docker(cmd=command, container_name=cname)
 
-    if args.on == "HEAD":
-        with ssh.SSHClusterCommandRunner(cluster=cls, parallel=True).in_head() as run:
-            _ = run(cmd=command, print_output=True)
+    policy = base.RetryPolicy(retries=args.retries, deadline=args.deadline)
+
+    with output.OutputMultiplexer(spill_dir=args.output_dir) as multiplexer:
+
+        runner = backends.cluster_runner(cluster=cls,
+                                         parallel=True,
+                                         multiplexer=multiplexer)
+
+        outcomes = runner.run_outcomes(cmd=command,
+                                       on=args.on,
+                                       timeout=args.timeout,
+                                       print_output=True,
+                                       policy=policy)
 
-    elif args.on == "WORKERS":
-        with ssh.SSHClusterCommandRunner(cluster=cls, parallel=True).in_workers() as run:
-            _ = run(cmd=command, print_output=True)
+    utils.report.print_outcomes(outcomes=outcomes)
 
-    elif args.on == "CLUSTER":
-        with ssh.SSHClusterCommandRunner(cluster=cls, parallel=True).in_cluster() as run:
-            _ = run(cmd=command, print_output=True)
+    failed_hosts = [host for host, outcome in outcomes.items() if outcome.failed]
+
+    if len(failed_hosts) != 0:
+        raise RuntimeError(f"Command failed in hosts: [{', '.join(failed_hosts)}]")
+
+
+def execute(args: Namespace) -> None:
 
-    else:
-        raise RuntimeError(f"'{args.on}' not recognized")
+    with utils.tracing.tracing(path=args.trace):
+        execute_command(args=args)
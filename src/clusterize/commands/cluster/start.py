@@ -1,10 +1,17 @@
+import copy
+import time
 import fabric
 import tempfile
+import dataclasses
 from pathlib import Path
-from fabric import transfer
 from argparse import Namespace
-from clusterize.executors import ssh
+from functools import partial
+from typing import Callable, Dict, List
+from dataclasses import dataclass
+from clusterize import executors
+from clusterize.executors import agent, backends, base, pipeline, ssh, transfer
 from clusterize import utils, structures
+from clusterize.commands.cluster import sync
 
 
 def check_clean_docker_cluster(cluster: structures.cluster.Cluster) -> None:
@@ -13,7 +20,7 @@ def check_clean_docker_cluster(cluster: structures.cluster.Cluster) -> None:
     cname = cluster.docker.container_name if cluster.docker.container_name != "" \
         else cluster.cluster_name
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_cluster() as run:
+    with backends.cluster_runner(cluster=cluster, parallel=True).in_cluster() as run:
 
         ps = f"docker ps -f 'name={cname}' --format '{{.Names}}'"
         results = run(cmd=ps)
@@ -35,109 +42,598 @@ def check_clean_docker_cluster(cluster: structures.cluster.Cluster) -> None:
                 f"continuing.")
 
 
-def deploy_cluster_resources(cluster: structures.cluster.Cluster) -> None:
+def deploy_cluster_resources(cluster: structures.cluster.Cluster,
+                             max_transfers: int = transfer.DEFAULT_MAX_TRANSFERS,
+                             tree: bool = False) -> None:
 
     handle, tmpfile = tempfile.mkstemp(prefix="cluster_bootstrap")
 
-    # Write the bootstrap cluster yaml
-    with open(handle, 'w') as f:
-        yaml = cluster.to_yaml()
-        f.write(yaml)
+    try:
+        # Write the bootstrap cluster yaml
+        with open(handle, 'w') as f:
+            yaml = cluster.to_yaml()
+            f.write(yaml)
 
-    # Deploy the bootstrap yaml to all cluster nodes
-    ssh_key = Path(cluster.auth.ssh_private_key).expanduser().absolute()
-    hosts = [cluster.provider.head_ip] + cluster.provider.worker_ips
+        # Deploy the bootstrap yaml, the ssh key and the node agent to all cluster nodes.
+        # The key goes first since in tree mode the head uses it to reach the workers.
+        ssh_key = Path(cluster.auth.ssh_private_key).expanduser().absolute()
+        transfers = [
+            transfer.FileTransfer(local=str(ssh_key), remote="cluster_ssh_key.pem"),
+            transfer.FileTransfer(local=tmpfile, remote="cluster_bootstrap.yaml"),
+            transfer.FileTransfer(local=str(agent.agent_source()),
+                                  remote=agent.agent_remote_path())]
 
-    for host in tuple(hosts):
+        head_info = ssh.SSHClusterCommandRunner.head_connection_info(cluster=cluster)
+        workers_info = ssh.SSHClusterCommandRunner.workers_connection_info(
+            cluster=cluster)
 
-        connection = fabric.Connection(
-            host=host,
-            user=cluster.auth.ssh_user,
-            connect_kwargs={'key_filename': str(ssh_key)})
+        if tree:
+            _ = transfer.put_in_cluster_tree(head_info=head_info,
+                                             workers_info=workers_info,
+                                             transfers=transfers,
+                                             head_ssh_key="cluster_ssh_key.pem",
+                                             max_transfers=max_transfers)
+        elif backends.executor_name() == "agent":
+            # The agents install themselves, the other files travel on their channels
+            cluster_info = ssh.SSHClusterCommandRunner.cluster_connection_info(
+                cluster=cluster)
+            agent.put_in_hosts(group_info=cluster_info,
+                               transfers=transfers[:2],
+                               max_transfers=max_transfers)
+        else:
+            cluster_info = ssh.SSHClusterCommandRunner.cluster_connection_info(
+                cluster=cluster)
+            _ = transfer.put_in_hosts(group_info=cluster_info,
+                                      transfers=transfers,
+                                      max_transfers=max_transfers)
+    finally:
+        Path(tmpfile).unlink()
 
-        result: transfer.Result = connection.put(local=tmpfile,
-                                                 remote="cluster_bootstrap.yaml")
 
-        result: transfer.Result = connection.put(local=str(ssh_key),
-                                                 remote="cluster_ssh_key.pem")
+def resolve_image_digests(cluster: structures.cluster.Cluster) -> Dict[str, str]:
 
+    images = {utils.docker.head_image(docker=cluster.docker),
+              utils.docker.worker_image(docker=cluster.docker)}
 
-def initialize(cluster: structures.cluster.Cluster) -> None:
+    digests = {img: utils.docker.pinned_digest(image=img) for img in images}
+    unpinned = [img for img, digest in digests.items() if digest is None]
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_cluster() as run:
+    if len(unpinned) == 0:
+        return digests
 
-        for init_cmd in cluster.initialization_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+    # Query the registry only once, from the head
+    with backends.cluster_runner(cluster=cluster).in_head() as run:
 
+        for img in unpinned:
 
-def setup(cluster: structures.cluster.Cluster) -> None:
+            result = run(cmd=utils.docker.registry_digest_cmd(image=img),
+                         allow_failures=True)
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_cluster() as run:
+            # If the registry cannot be queried, the nodes always pull
+            if result.ok and result.stdout.strip().startswith("sha256:"):
+                digests[img] = result.stdout.strip()
 
-        for init_cmd in cluster.setup_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+    return digests
 
 
-def head_setup(cluster: structures.cluster.Cluster) -> None:
+def image_preflight(cluster: structures.cluster.Cluster,
+                    image_digests: Dict[str, str]) -> List[str]:
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_head() as run:
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    images = {"HEAD": utils.docker.head_image(docker=cluster.docker),
+              "WORKERS": utils.docker.worker_image(docker=cluster.docker)}
 
-        for init_cmd in cluster.head_setup_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+    stale_hosts = []
 
+    for on, img in images.items():
 
-def worker_setup(cluster: structures.cluster.Cluster) -> None:
+        outcomes = runner.run_outcomes(cmd=utils.docker.local_digests_cmd(image=img),
+                                       on=on)
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_workers() as run:
+        for host, outcome in outcomes.items():
 
-        for init_cmd in cluster.worker_setup_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+            local_digests = outcome.result.stdout.split() if not outcome.failed else []
+            digest = image_digests.get(img, None)
 
+            if utils.docker.is_image_fresh(local_digests=local_digests, digest=digest):
+                print(f"[{host}] Image {img} up to date ({digest})")
+            else:
+                print(f"[{host}] Image {img} needs to be pulled")
+                stale_hosts.append(host)
 
-def head_start_ray(cluster: structures.cluster.Cluster) -> None:
+    return stale_hosts
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_head() as run:
 
-        for init_cmd in cluster.head_start_ray_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+def distribute_docker_image(cluster: structures.cluster.Cluster,
+                            fanout: int = transfer.DEFAULT_IMAGE_FANOUT,
+                            image_digests: Dict[str, str] = None,
+                            stale_hosts: List[str] = None) -> None:
 
+    image_digests = image_digests if image_digests is not None else {}
 
-def worker_start_ray(cluster: structures.cluster.Cluster) -> None:
+    head_img = utils.docker.head_image(docker=cluster.docker)
+    worker_img = utils.docker.worker_image(docker=cluster.docker)
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster, parallel=True).in_workers() as run:
+    head_info = ssh.SSHClusterCommandRunner.head_connection_info(cluster=cluster)
+    workers_info = ssh.SSHClusterCommandRunner.workers_connection_info(cluster=cluster)
 
-        for init_cmd in cluster.worker_start_ray_commands:
-            _ = run(cmd=init_cmd, print_output=True)
+    # Only the stale workers need to receive the image
+    if stale_hosts is not None:
+        workers_info = dataclasses.replace(
+            workers_info, ips=[ip for ip in workers_info.ips if ip in stale_hosts])
 
+    # Only the head pulls from the registry
+    pull = " && ".join(utils.docker.pull_cmd(image=img, digest=image_digests.get(img, None))
+                       for img in dict.fromkeys([head_img, worker_img]))
+    connection = ssh.connection_pool.connection(node_info=head_info)
 
-def start(args: Namespace) -> None:
+    with utils.tracing.tracer.in_phase(phase="pull_image"), \
+            executors.output.OutputMultiplexer() as multiplexer:
+        _ = ssh.SSHCommandRunner.run_connection(connection=connection,
+                                                cmd=pull,
+                                                timeout=None,
+                                                print_output=True,
+                                                allow_failures=False,
+                                                multiplexer=multiplexer)
+
+    # The workers receive the image from the nodes that already have it
+    with utils.tracing.tracer.phase_span(phase="distribute_image"):
+        _ = transfer.put_image_in_cluster_tree(head_info=head_info,
+                                               workers_info=workers_info,
+                                               image=worker_img,
+                                               head_ssh_key="cluster_ssh_key.pem",
+                                               fanout=fanout)
+
+
+HEAD_PHASES = ["initialization", "setup", "head_setup", "head_start_ray"]
+WORKER_PHASES = ["initialization", "setup", "worker_setup", "worker_start_ray"]
+
+
+@dataclass
+class StartOptions:
+
+    batch: bool = False
+    timeout: float = None
+    policy: base.RetryPolicy = dataclasses.field(default_factory=base.RetryPolicy)
+    state: utils.state.StartState = None
+
+
+def phase_digest(cluster: structures.cluster.Cluster, phase: str) -> str:
+
+    phases = HEAD_PHASES if phase in HEAD_PHASES else WORKER_PHASES
+    digest = ""
+
+    for p in phases[:phases.index(phase) + 1]:
+        digest = utils.state.phase_hash(commands=getattr(cluster, f"{p}_commands"),
+                                        previous=digest)
+
+    return digest
+
+
+def run_phase(runner: base.CommandClusterRunner,
+              commands: List[str],
+              on: str = "CLUSTER",
+              hosts: List[str] = None,
+              options: StartOptions = StartOptions(),
+              phase: str = None,
+              digest: str = None) -> None:
+
+    # Phases of a single node (e.g. pipelined start) are traced in its own track
+    host = hosts[0] if hosts is not None and len(hosts) == 1 else None
+
+    with utils.tracing.tracer.phase_span(phase=phase if phase is not None else "phase",
+                                         host=host):
+        run_phase_commands(runner=runner, commands=commands, on=on, hosts=hosts,
+                           options=options, phase=phase, digest=digest)
+
+
+def run_phase_commands(runner: base.CommandClusterRunner,
+                       commands: List[str],
+                       on: str = "CLUSTER",
+                       hosts: List[str] = None,
+                       options: StartOptions = StartOptions(),
+                       phase: str = None,
+                       digest: str = None) -> None:
+
+    track = options.state is not None and phase is not None and digest is not None
+
+    # Skip the nodes that already completed the phase in a previous start
+    if track and hosts is not None:
+
+        for host in hosts:
+            if options.state.completed(host=host, phase=phase, digest=digest):
+                print(f"[{host}] Phase '{phase}' already completed")
+
+        hosts = [host for host in hosts
+                 if not options.state.completed(host=host, phase=phase, digest=digest)]
+
+        if len(hosts) == 0:
+            return
+
+    if len(commands) == 0:
+        return
+
+    started = time.monotonic()
+    failed_hosts = []
+
+    # Send all the commands at once and split back the results of each step
+    if options.batch:
+        phase_commands = [executors.batch.compile_script(commands=commands)]
+    else:
+        phase_commands = commands
+
+    for cmd in phase_commands:
+
+        # The deadline of the policy refers to the whole phase
+        policy = options.policy
+
+        if policy.deadline is not None:
+            elapsed = time.monotonic() - started
+            policy = dataclasses.replace(policy, deadline=policy.deadline - elapsed)
+
+        outcomes = runner.run_outcomes(cmd=cmd,
+                                       on=on,
+                                       hosts=hosts,
+                                       timeout=options.timeout,
+                                       print_output=not options.batch,
+                                       policy=policy)
+
+        if options.batch:
+            for host, outcome in outcomes.items():
+                if outcome.result is not None:
+                    steps = executors.batch.parse_output(commands=commands,
+                                                         stdout=outcome.result.stdout)
+                    executors.batch.print_steps(host=host, steps=steps)
+
+        utils.report.print_outcomes(outcomes=outcomes)
+
+        # The remaining commands run only in the nodes where the phase is going fine
+        failed_hosts += [host for host, outcome in outcomes.items() if outcome.failed]
+        hosts = [host for host, outcome in outcomes.items() if not outcome.failed]
+
+        if len(hosts) == 0:
+            break
+
+    # Record the nodes that completed the phase, so that a new start can resume
+    if track and len(hosts) != 0:
+        mark_phase(runner=runner, on=on, hosts=hosts, options=options, phase=phase,
+                   digest=digest)
+
+    if len(failed_hosts) != 0:
+        raise RuntimeError(f"Commands failed in hosts: [{', '.join(failed_hosts)}]")
+
+
+def mark_phase(runner: base.CommandClusterRunner,
+               on: str,
+               hosts: List[str],
+               options: StartOptions,
+               phase: str,
+               digest: str) -> None:
+
+    cmd = utils.state.mark_phase_cmd(session=options.state.session, phase=phase,
+                                     digest=digest)
+
+    outcomes = runner.run_outcomes(cmd=cmd, on=on, hosts=hosts, timeout=options.timeout)
+
+    for host, outcome in outcomes.items():
+        if not outcome.failed:
+            options.state.record(host=host, phase=phase, digest=digest)
+
+    options.state.save()
+
+
+def run_cluster_phase(cluster: structures.cluster.Cluster,
+                      phase: str,
+                      on: str,
+                      options: StartOptions = StartOptions()) -> None:
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    hosts = ssh.SSHClusterCommandRunner.group_connection_info(cluster=cluster, on=on).ips
+
+    run_phase(runner=runner,
+              commands=getattr(cluster, f"{phase}_commands"),
+              on=on,
+              hosts=hosts,
+              options=options,
+              phase=phase,
+              digest=phase_digest(cluster=cluster, phase=phase))
+
+
+def initialize(cluster: structures.cluster.Cluster,
+               options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="initialization", on="CLUSTER",
+                      options=options)
+
+
+def setup(cluster: structures.cluster.Cluster,
+          options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="setup", on="CLUSTER", options=options)
+
+
+def head_setup(cluster: structures.cluster.Cluster,
+               options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="head_setup", on="HEAD", options=options)
+
+
+def worker_setup(cluster: structures.cluster.Cluster,
+                 options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="worker_setup", on="WORKERS",
+                      options=options)
+
+
+def head_start_ray(cluster: structures.cluster.Cluster,
+                   options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="head_start_ray", on="HEAD",
+                      options=options)
+
+
+def worker_start_ray(cluster: structures.cluster.Cluster,
+                     options: StartOptions = StartOptions()) -> None:
+
+    run_cluster_phase(cluster=cluster, phase="worker_start_ray", on="WORKERS",
+                      options=options)
 
-    project_data = utils.project.get_project_data(project_folder=args.project_dir)
 
-    if project_data is None:
-        raise RuntimeError(f"No project found in '{project_data.directory}'")
+def place_session(cluster: structures.cluster.Cluster,
+                  project_dir: str,
+                  cpus: int = 0,
+                  gpus: int = 0,
+                  workers: int = None) -> structures.cluster.Cluster:
 
-    with open(file=project_data.cluster, mode='r') as f:
-        cls: structures.cluster.Cluster = structures.cluster.Cluster.from_yaml(data=f)
+    from clusterize.commands.cluster import topology
+
+    nodes_info = topology.get_extra_nodes_info(cluster=cluster, project_dir=project_dir)
+
+    nodes = [utils.placement.NodeLoad(ip=ip,
+                                      cpus=nodes_info[ip].processing_units or 0,
+                                      gpus=nodes_info[ip].gpus or 0)
+             for ip in cluster.provider.worker_ips if ip in nodes_info]
+
+    # Account for the resources reserved by the sessions already running
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    outcomes = runner.run_outcomes(cmd=utils.placement.USAGE_CMD,
+                                   on="CLUSTER",
+                                   hosts=[n.ip for n in nodes])
+
+    for node in nodes:
+        if outcomes[node.ip].failed:
+            node.used_cpus, node.used_gpus = node.cpus, node.gpus
+        else:
+            utils.placement.add_usage(node=node, stdout=outcomes[node.ip].result.stdout)
+
+    worker_ips = utils.placement.place(nodes=nodes, cpus=cpus, gpus=gpus, workers=workers)
+    print(f"Placing the session on workers: [{', '.join(worker_ips)}]")
+
+    placed = copy.deepcopy(cluster)
+    placed.provider.worker_ips = worker_ips
+
+    return placed
+
+
+def load_start_state(cluster: structures.cluster.Cluster,
+                     state: utils.state.StartState) -> None:
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    outcomes = runner.run_outcomes(cmd=utils.state.read_phases_cmd(session=state.session),
+                                   on="CLUSTER")
+
+    # Unreachable nodes just restart from the first phase
+    for host, outcome in outcomes.items():
+        if not outcome.failed:
+            state.set_node_phases(host=host, stdout=outcome.result.stdout)
+
+
+def remove_incomplete_containers(cluster: structures.cluster.Cluster,
+                                 state: utils.state.StartState) -> None:
+
+    # Name of the docker containers
+    cname = cluster.docker.container_name if cluster.docker.container_name != "" \
+        else cluster.cluster_name
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+
+    # Containers started by phases that did not complete are started again
+    for on, phase in (("HEAD", "head_setup"), ("WORKERS", "worker_setup")):
+
+        digest = phase_digest(cluster=cluster, phase=phase)
+        ips = ssh.SSHClusterCommandRunner.group_connection_info(cluster=cluster, on=on).ips
+        hosts = [ip for ip in ips
+                 if not state.completed(host=ip, phase=phase, digest=digest)]
+
+        _ = runner.run_outcomes(cmd=f"docker rm -f {cname} > /dev/null 2>&1 || true",
+                                on=on,
+                                hosts=hosts)
+
+
+def pipelined_start_tasks(cluster: structures.cluster.Cluster,
+                          options: StartOptions = StartOptions(),
+                          distribute_image: Callable[[], None] = None) \
+        -> List[pipeline.Task]:
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    head_ip = cluster.provider.head_ip
+
+    def node_tasks(ip: str,
+                   phases: List[str],
+                   extra_dependencies: Dict[str, List[str]]) -> List[pipeline.Task]:
+
+        tasks = []
+        previous = None
+
+        for phase in phases:
+
+            name = f"{ip}:{phase}"
+            commands = getattr(cluster, f"{phase}_commands")
+
+            depends_on = [previous] if previous is not None else []
+            depends_on += extra_dependencies.get(phase, [])
+
+            tasks.append(pipeline.Task(
+                name=name,
+                function=partial(run_phase, runner=runner, commands=commands,
+                                 on="CLUSTER", hosts=[ip], options=options, phase=phase,
+                                 digest=phase_digest(cluster=cluster, phase=phase)),
+                depends_on=depends_on))
+
+            previous = name
+
+        return tasks
+
+    head_dependencies = {}
+    worker_dependencies = {"worker_start_ray": [f"{head_ip}:head_start_ray"]}
+    image_tasks = []
+
+    # The image is distributed once all the nodes are set up, and no container
+    # can start before it completes
+    if distribute_image is not None:
+
+        image_tasks.append(pipeline.Task(
+            name="image:distribute",
+            function=distribute_image,
+            depends_on=[f"{ip}:setup" for ip in [head_ip] + cluster.provider.worker_ips]))
+
+        head_dependencies["head_setup"] = ["image:distribute"]
+        worker_dependencies["worker_setup"] = ["image:distribute"]
+
+    # Each node progresses independently, workers only need a running Ray head
+    tasks = node_tasks(ip=head_ip, phases=HEAD_PHASES,
+                       extra_dependencies=head_dependencies)
+
+    for ip in cluster.provider.worker_ips:
+        tasks += node_tasks(ip=ip, phases=WORKER_PHASES,
+                            extra_dependencies=worker_dependencies)
+
+    return tasks + image_tasks
+
+
+def pipelined_start(cluster: structures.cluster.Cluster,
+                    options: StartOptions = StartOptions(),
+                    distribute_image: Callable[[], None] = None) -> None:
+
+    tasks = pipelined_start_tasks(cluster=cluster,
+                                  options=options,
+                                  distribute_image=distribute_image)
+
+    outcomes = pipeline.run_dag(tasks=tasks)
+
+    failed = [o for o in outcomes.values() if o.exception is not None]
+    skipped = [o for o in outcomes.values() if o.skipped]
+
+    for outcome in failed:
+        print(f"Task '{outcome.name}' failed: {outcome.exception}")
+
+    if len(failed) != 0:
+        raise RuntimeError(f"{len(failed)} tasks failed and {len(skipped)} were skipped")
+
+
+def start_session(args: Namespace) -> None:
+
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
+
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
+
+    project_data = project_config.data
+    cls: structures.cluster.Cluster = project_config.cluster
 
     if args.session is None:
         args.session = project_data.name
 
+    # Start only in the least loaded workers with enough free resources
+    place = args.cpus is not None or args.gpus is not None
+
+    if place:
+        cls = place_session(cluster=cls,
+                            project_dir=project_data.directory,
+                            cpus=args.cpus or 0,
+                            gpus=args.gpus or 0,
+                            workers=args.workers)
+
+    state = utils.state.StartState(project_dir=project_data.directory,
+                                   session=args.session)
+
+    pull = cls.docker is not None and cls.docker.pull_before_run
+
+    # Check which nodes already have the wanted images, the others will pull them
+    with utils.tracing.tracer.phase_span(phase="image_preflight"):
+        image_digests = resolve_image_digests(cluster=cls) if pull else {}
+        stale_hosts = image_preflight(cluster=cls, image_digests=image_digests) \
+            if pull else []
+
+    # The head pulls the image and then distributes it to the stale workers
+    distribute_image = None
+
+    if pull and args.distribute_image:
+        distribute_image = partial(distribute_docker_image,
+                                   cluster=cls,
+                                   fanout=args.image_fanout,
+                                   image_digests=image_digests,
+                                   stale_hosts=stale_hosts)
+
     if cls.docker is not None:
-        cls = utils.docker.dockerize_cluster(cluster=cls)
-        check_clean_docker_cluster(cluster=cls)
+        cls = utils.docker.dockerize_cluster(cluster=cls,
+                                             distribute_image=distribute_image is not None,
+                                             image_digests=image_digests,
+                                             session=args.session,
+                                             cpus=args.cpus,
+                                             gpus=args.gpus)
+
+        # Resuming continues from the phases that each node completed, and the
+        # containers of the previous start are expected to be running
+        if args.resume:
+            load_start_state(cluster=cls, state=state)
+            remove_incomplete_containers(cluster=cls, state=state)
+        else:
+            state.invalidate()
+            check_clean_docker_cluster(cluster=cls)
     else:
         raise NotImplementedError
 
     # Deploy the bootstrapped cluster yaml and the ssh key
-    deploy_cluster_resources(cluster=cls)
+    with utils.tracing.tracer.phase_span(phase="deploy_cluster_resources"):
+        deploy_cluster_resources(cluster=cls,
+                                 max_transfers=args.max_transfers,
+                                 tree=args.tree_transfer)
+
+    # Push the file mounts, only what changed since the previous start
+    with utils.tracing.tracer.phase_span(phase="file_mounts"):
+        sync.sync_file_mounts(cluster=cls,
+                              project_dir=project_data.directory,
+                              max_transfers=args.max_transfers)
+
+    options = StartOptions(batch=args.batch,
+                           timeout=args.timeout,
+                           policy=base.RetryPolicy(retries=args.retries,
+                                                   deadline=args.phase_deadline),
+                           state=state)
+
+    if args.pipeline:
+        pipelined_start(cluster=cls,
+                        options=options,
+                        distribute_image=distribute_image)
+        return
 
     # Execute initialization and setup commands in the cluster
-    initialize(cluster=cls)
-    setup(cluster=cls)
-    head_setup(cluster=cls)
-    worker_setup(cluster=cls)
+    initialize(cluster=cls, options=options)
+    setup(cluster=cls, options=options)
+
+    if distribute_image is not None:
+        distribute_image()
+
+    head_setup(cluster=cls, options=options)
+    worker_setup(cluster=cls, options=options)
 
     # Start Ray
-    head_start_ray(cluster=cls)
-    worker_start_ray(cluster=cls)
+    head_start_ray(cluster=cls, options=options)
+    worker_start_ray(cluster=cls, options=options)
+
+
+def start(args: Namespace) -> None:
+
+    with utils.tracing.tracing(path=args.trace):
+        start_session(args=args)
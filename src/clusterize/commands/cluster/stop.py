@@ -1,20 +1,73 @@
+import time
 from argparse import Namespace
-from clusterize.executors import ssh
+from clusterize.executors import backends
 from clusterize import structures, utils
 
+DEFAULT_GRACE = 10.0
+DEFAULT_DEADLINE_MARGIN = 10.0
+# Part of the deadline reserved to kill the containers that did not stop
+DEFAULT_KILL_TIMEOUT = 5.0
+
 
 def stop_cluster_with_docker(cluster: structures.cluster.Cluster,
-                             session: str) -> None:
+                             session: str,
+                             grace: float = DEFAULT_GRACE,
+                             deadline: float = None) -> None:
 
     if session is None:
-        filter = "docker ps -q -f label=clusterize"
+        filter = "-f label=clusterize"
     else:
-        filter = f"docker ps -q -f label=clusterize.session={session}"
+        filter = f"-f label=clusterize.session={session}"
+
+    # The nodes that did not stop within the deadline get their containers killed
+    if deadline is None:
+        deadline = grace + DEFAULT_DEADLINE_MARGIN
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+
+    # Both docker stop and docker kill print the names of the affected containers
+    names = f"$(docker ps {filter} --format '{{{{.Names}}}}')"
+    stop_cmd = f'names={names}; [ -z "$names" ] || docker stop -t {int(grace)} $names'
+    kill_cmd = f'names={names}; [ -z "$names" ] || docker kill $names'
+
+    # Stopping and killing the containers together last at most the deadline.
+    # The kill gets what the stop left, and never less than its reserved part.
+    kill_timeout = min(DEFAULT_KILL_TIMEOUT, deadline / 2)
+    started = time.monotonic()
+
+    outcomes = runner.run_outcomes(cmd=stop_cmd, on="CLUSTER",
+                                   timeout=deadline - kill_timeout)
+    failed_hosts = [host for host, outcome in outcomes.items() if outcome.failed]
+
+    remaining = deadline - (time.monotonic() - started)
+    killed = runner.run_outcomes(cmd=kill_cmd, on="CLUSTER", hosts=failed_hosts,
+                                 timeout=max(remaining, kill_timeout))
 
-    with ssh.SSHClusterCommandRunner(cluster=cluster).in_cluster() as run:
+    for host, outcome in sorted(outcomes.items()):
 
-        cmd = f'[ -n "$({filter})" ] && docker stop $({filter}) || true'
-        _ = run(cmd=cmd)
+        action = "stopped"
+
+        if host in killed:
+            action = "killed"
+            outcome = killed[host]
+
+        if outcome.failed:
+            print(f"[{host}] failed to stop the containers")
+            continue
+
+        stopped = outcome.result.stdout.split()
+        print(f"[{host}] {action}: {', '.join(stopped)}" if len(stopped) != 0
+              else f"[{host}] no containers to stop")
+
+    # A stopped session cannot be resumed
+    _ = runner.run_outcomes(cmd=utils.state.clear_phases_cmd(session=session),
+                            on="CLUSTER", timeout=deadline)
+
+    not_stopped = [host for host, outcome in killed.items() if outcome.failed]
+
+    if len(not_stopped) != 0:
+        raise RuntimeError(f"Failed to stop the containers in hosts: "
+                           f"[{', '.join(not_stopped)}]")
 
 
 def stop_cluster() -> None:
@@ -23,15 +76,23 @@ def stop_cluster() -> None:
 
 def stop(args: Namespace) -> None:
 
-    project_data = utils.project.get_project_data(project_folder=args.project_dir)
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
 
-    if project_data is None:
-        raise RuntimeError(f"No project found in '{project_data.directory}'")
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
 
-    with open(file=project_data.cluster, mode='r') as f:
-        cls: structures.cluster.Cluster = structures.cluster.Cluster.from_yaml(data=f)
+    project_data = project_config.data
+    cls: structures.cluster.Cluster = project_config.cluster
 
     if cls.docker is not None:
-        stop_cluster_with_docker(cluster=cls, session=args.session)
+        stop_cluster_with_docker(cluster=cls,
+                                 session=args.session,
+                                 grace=args.grace,
+                                 deadline=args.deadline)
     else:
         stop_cluster()
+
+    state = utils.state.StartState(project_dir=project_data.directory,
+                                   session=args.session)
+    state.invalidate()
+    state.save()
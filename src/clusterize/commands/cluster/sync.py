@@ -0,0 +1,146 @@
+import os
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from clusterize.executors import backends, ssh, transfer
+from clusterize import structures, utils
+
+
+def sync_node(node_info: ssh.NodeConnectionInfo,
+              plans: List[utils.sync.MountPlan],
+              phase: str = None) -> None:
+
+    for plan in plans:
+
+        mount = plan.mount
+        remote_dir = utils.sync.remote_path_expr(path=mount.remote_dir)
+
+        if len(plan.send) != 0:
+
+            if mount.is_file:
+                files = [(str(mount.local), plan.send[0])]
+            else:
+                files = [(os.path.join(mount.local, rel), rel) for rel in plan.send]
+
+            transfer.put_files_tar(node_info=node_info,
+                                   files=files,
+                                   remote_dir_expr=remote_dir,
+                                   phase=phase)
+
+        if len(plan.delete) != 0:
+            _ = transfer.run_with_input(
+                node_info=node_info,
+                cmd=f"cd {remote_dir} && xargs -0 rm -f --",
+                write=lambda w: w.write("\0".join(plan.delete).encode()),
+                phase=phase)
+
+        # The manifest is stored last, an interrupted sync is completed by the
+        # next one
+        manifest = utils.sync.remote_manifest_path_expr(mount=mount)
+        _ = transfer.run_with_input(
+            node_info=node_info,
+            cmd=f'mkdir -p "$HOME"/{utils.sync.REMOTE_MANIFEST_DIR} && '
+                f'cat > {manifest}.tmp && mv {manifest}.tmp {manifest}',
+            write=lambda w: w.write(utils.sync.manifest_data(manifest=plan.manifest)),
+            phase=phase)
+
+
+def sync_file_mounts(cluster: structures.cluster.Cluster,
+                     project_dir: str,
+                     max_transfers: int = transfer.DEFAULT_MAX_TRANSFERS) -> None:
+
+    if len(cluster.file_mounts) == 0:
+        return
+
+    started = time.monotonic()
+    mounts = utils.sync.get_mounts(file_mounts=cluster.file_mounts,
+                                   project_dir=project_dir)
+
+    # Hash the local files, only the files changed since the last sync are read
+    cache = utils.sync.HashCache()
+    local = {m.manifest_name: utils.sync.local_manifest(mount=m, cache=cache)
+             for m in mounts}
+    cache.save()
+
+    # Get what the nodes received in the previous syncs with a single command
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    outcomes = runner.run_outcomes(cmd=utils.sync.remote_state_cmd(mounts=mounts),
+                                   on="CLUSTER")
+
+    failed = [host for host, outcome in outcomes.items() if outcome.failed]
+
+    if len(failed) != 0:
+        utils.report.print_outcomes(outcomes=outcomes)
+        raise RuntimeError(f"Failed to get the synced files from hosts: "
+                           f"[{', '.join(failed)}]")
+
+    plans: Dict[str, List[utils.sync.MountPlan]] = {}
+
+    for host, outcome in outcomes.items():
+
+        state = utils.sync.parse_remote_state(stdout=outcome.result.stdout)
+
+        plans[host] = [
+            utils.sync.plan_mount(mount=m,
+                                  local=local[m.manifest_name],
+                                  remote_manifest=state.get(m.manifest_name, ({}, {}))[0],
+                                  remote_stats=state.get(m.manifest_name, ({}, {}))[1])
+            for m in mounts]
+
+        plans[host] = [p for p in plans[host] if p.changed]
+
+    cluster_info = ssh.SSHClusterCommandRunner.cluster_connection_info(cluster=cluster)
+    phase = utils.tracing.tracer.phase
+
+    # Every node receives only its changed files, all the nodes in parallel
+    with ThreadPoolExecutor(max_workers=max_transfers) as executor:
+
+        futures = {
+            host: executor.submit(sync_node,
+                                  ssh.NodeConnectionInfo(
+                                      ip=host,
+                                      username=cluster_info.username,
+                                      ssh_private_key=cluster_info.ssh_private_key),
+                                  host_plans,
+                                  phase)
+            for host, host_plans in plans.items() if len(host_plans) != 0}
+
+        errors = {}
+
+        for host, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                errors[host] = e
+
+    for host, host_plans in sorted(plans.items()):
+
+        sent = sum(len(p.send) for p in host_plans)
+        deleted = sum(len(p.delete) for p in host_plans)
+
+        if host in errors:
+            print(f"[{host}] sync failed: {errors[host]}")
+        elif sent == 0 and deleted == 0:
+            print(f"[{host}] up to date")
+        else:
+            print(f"[{host}] sent {sent} files, deleted {deleted} files")
+
+    if len(errors) != 0:
+        raise RuntimeError(f"Failed to sync the file mounts in hosts: "
+                           f"[{', '.join(sorted(errors))}]")
+
+    print(f"Synced {len(mounts)} file mounts in {time.monotonic() - started:.2f}s")
+
+
+def sync(args: Namespace) -> None:
+
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
+
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
+
+    with utils.tracing.tracing(path=args.trace):
+        sync_file_mounts(cluster=project_config.cluster,
+                         project_dir=project_config.data.directory,
+                         max_transfers=args.max_transfers)
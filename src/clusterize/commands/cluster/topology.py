@@ -1,10 +1,10 @@
-from typing import List
+from typing import Any, Dict, List
 from argparse import Namespace
 from operator import itemgetter
 from tree_format import format_tree
-from clusterize.executors import ssh
+from clusterize.executors import backends
 from clusterize import structures, utils
-from dataclasses import dataclass, field, astuple
+from dataclasses import dataclass, field, fields, asdict, astuple
 
 
 @dataclass()
@@ -12,6 +12,7 @@ class ExtraNodeInfo:
 
     gpus: int = None
     processing_units: int = None
+    boot_id: str = None
 
 
 @dataclass
@@ -21,33 +22,102 @@ class TreeNode:
     children: List["TreeNode"] = field(default_factory=list)
 
 
-def get_extra_node_info(username: str, ip: str, ssh_key: str) -> ExtraNodeInfo:
+# Single round trip gathering all the information printed as key=value lines
+BOOT_ID_CMD = 'echo "boot_id=$(cat /proc/sys/kernel/random/boot_id)"'
+PROBE_CMD = BOOT_ID_CMD + '; echo "processing_units=$(nproc)"; ' \
+            'if which nvidia-settings > /dev/null 2>&1; then ' \
+            'echo "gpus=$(nvidia-smi --query-gpu=name --format=csv,noheader | wc -l)"; ' \
+            'else echo "gpus=0"; fi'
 
-    info = ssh.NodeConnectionInfo(ip=ip, username=username, ssh_private_key=ssh_key)
 
-    with ssh.SSHCommandRunner(node_info=info) as runner:
+def parse_probe(stdout: str) -> ExtraNodeInfo:
 
-        nproc_result = runner.run(cmd="nproc")
-        which_result = runner.run(cmd="which nvidia-settings", allow_failures=True)
+    extra_node_info = ExtraNodeInfo()
+    types = {f.name: f.type for f in fields(ExtraNodeInfo)}
 
-        if not which_result.failed:
-            cmd = "nvidia-smi --query-gpu=name --format=csv,noheader | wc -l"
-            nvidia_smi_result = runner.run(cmd=cmd)
+    for line in stdout.splitlines():
 
-        extra_node_info = ExtraNodeInfo()
+        key, sep, value = line.strip().partition("=")
 
-        if not nproc_result.failed:
-            extra_node_info.processing_units = int(nproc_result.stdout)
+        if sep == "" or key not in types:
+            continue
 
-        if not which_result.failed and not nvidia_smi_result.failed:
-            extra_node_info.gpus = int(nvidia_smi_result.stdout)
-        else:
-            extra_node_info.gpus = 0
+        try:
+            setattr(extra_node_info, key, types[key](value))
+        except ValueError:
+            pass
 
-        return extra_node_info
+    return extra_node_info
 
 
-def node_description(ip: str, username: str, extra_info: ExtraNodeInfo = None) -> str:
+def probe_nodes(cluster: structures.cluster.Cluster,
+                hosts: List[str] = None,
+                cmd: str = PROBE_CMD) -> Dict[str, ExtraNodeInfo]:
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    outcomes = runner.run_outcomes(cmd=cmd, on="CLUSTER", hosts=hosts)
+
+    utils.report.print_outcomes(outcomes=outcomes)
+
+    return {host: parse_probe(stdout=outcome.result.stdout)
+            for host, outcome in outcomes.items() if not outcome.failed}
+
+
+def get_extra_nodes_info(cluster: structures.cluster.Cluster,
+                         project_dir: str,
+                         refresh: bool = False,
+                         check_boot: bool = False,
+                         ttl: float = utils.inventory.DEFAULT_TTL) \
+        -> Dict[str, ExtraNodeInfo]:
+
+    inventory = utils.inventory.Inventory(project_dir=project_dir, ttl=ttl)
+    hosts = [cluster.provider.head_ip] + cluster.provider.worker_ips
+
+    boot_ids = None
+
+    # Detect the nodes that rebooted since they were cached with a cheap query
+    if check_boot and not refresh:
+
+        cached = [host for host in hosts if inventory.get(host=host) is not None]
+
+        if len(cached) != 0:
+            boot_ids = {host: info.boot_id
+                        for host, info in probe_nodes(cluster=cluster,
+                                                      hosts=cached,
+                                                      cmd=BOOT_ID_CMD).items()}
+
+    stale = hosts if refresh else inventory.stale_hosts(hosts=hosts, boot_ids=boot_ids)
+
+    if len(stale) != 0:
+
+        for host in stale:
+            inventory.invalidate(host=host)
+
+        for host, info in probe_nodes(cluster=cluster, hosts=stale).items():
+            inventory.put(host=host, info=asdict(info), boot_id=info.boot_id)
+
+        inventory.save()
+
+    return {host: ExtraNodeInfo(**inventory.get(host=host).info)
+            for host in hosts if inventory.get(host=host) is not None}
+
+
+def get_nodes_stats(cluster: structures.cluster.Cluster) -> Dict[str, Dict[str, Any]]:
+
+    # Only the node agents report the current load of the nodes
+    if backends.executor_name() != "agent":
+        return {}
+
+    from clusterize.executors import agent, ssh
+
+    return agent.stats(
+        group_info=ssh.SSHClusterCommandRunner.cluster_connection_info(cluster=cluster))
+
+
+def node_description(ip: str,
+                     username: str,
+                     extra_info: ExtraNodeInfo = None,
+                     stats: Dict[str, Any] = None) -> str:
 
     description = f"{username}@{ip}"
 
@@ -55,35 +125,39 @@ def node_description(ip: str, username: str, extra_info: ExtraNodeInfo = None) -
         and extra_info.gpus is not None and extra_info.processing_units is not None:
         description += f" (CPU={extra_info.processing_units}, GPU={extra_info.gpus})"
 
+    if stats is not None:
+        description += f" [load={stats['load'][0]:.2f}, " \
+                       f"mem={stats['mem_available'] / 2 ** 30:.1f}/" \
+                       f"{stats['mem_total'] / 2 ** 30:.1f}GiB free]"
+
     return description
 
 
 def topology(args: Namespace) -> None:
 
-    project_data = utils.project.get_project_data(args.project_dir)
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
 
-    if project_data is None:
-        raise RuntimeError(f"No project found in '{project_data.directory}'")
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
 
-    with open(file=project_data.cluster, mode='r') as f:
-        cls: structures.cluster.Cluster = structures.cluster.Cluster.from_yaml(data=f)
+    project_data = project_config.data
+    cls: structures.cluster.Cluster = project_config.cluster
 
     head_extra_info = None
     workers_extra_info = [None] * len(cls.provider.worker_ips)
+    stats = {}
 
     if args.full:
 
-        head_extra_info = get_extra_node_info(ip=cls.provider.head_ip,
-                                              username=cls.auth.ssh_user,
-                                              ssh_key=cls.auth.ssh_private_key)
+        extra_info = get_extra_nodes_info(cluster=cls,
+                                          project_dir=project_data.directory,
+                                          refresh=args.refresh,
+                                          check_boot=args.check_boot)
 
-        workers_extra_info = []
+        head_extra_info = extra_info.get(cls.provider.head_ip, None)
+        workers_extra_info = [extra_info.get(ip, None) for ip in cls.provider.worker_ips]
 
-        for ip in cls.provider.worker_ips:
-            extra_info = get_extra_node_info(ip=ip,
-                                             username=cls.auth.ssh_user,
-                                             ssh_key=cls.auth.ssh_private_key)
-            workers_extra_info.append(extra_info)
+        stats = get_nodes_stats(cluster=cls)
 
     root = TreeNode(name=project_data.name)
 
@@ -96,14 +170,16 @@ def topology(args: Namespace) -> None:
     # Add the head description
     head_node = TreeNode(name=node_description(ip=cls.provider.head_ip,
                                                username=cls.auth.ssh_user,
-                                               extra_info=head_extra_info))
+                                               extra_info=head_extra_info,
+                                               stats=stats.get(cls.provider.head_ip, None)))
     head.children.append(head_node)
 
     # Add the workers descriptions
     for ip, extra_info in zip(cls.provider.worker_ips, workers_extra_info):
         worker_node = TreeNode(name=node_description(ip=ip,
                                                      username=cls.auth.ssh_user,
-                                                     extra_info=extra_info))
+                                                     extra_info=extra_info,
+                                                     stats=stats.get(ip, None)))
         workers.children.append(worker_node)
 
     print(format_tree(
@@ -0,0 +1,3 @@
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["control"])
@@ -0,0 +1,63 @@
+import sys
+import time
+import subprocess
+from argparse import Namespace
+from clusterize import daemon, utils
+
+
+def start(args: Namespace) -> None:
+
+    if utils.project.get_project_config(project_folder=args.project_dir) is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
+
+    if daemon.control(project_dir=args.project_dir, command="status"):
+        print(f"Daemon already running for '{args.project_dir}'")
+        return
+
+    cmd = [sys.executable, "-m", "clusterize.daemon", args.project_dir,
+           "--idle-timeout", str(args.idle_timeout)]
+
+    if args.foreground:
+        subprocess.run(cmd, check=True)
+        return
+
+    log = daemon.log_path(project_dir=args.project_dir)
+    log.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    # Detach the daemon from the terminal of the CLI
+    with open(file=log, mode='a') as f:
+        process = subprocess.Popen(cmd,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=f,
+                                   stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+
+    started = time.monotonic()
+
+    while not daemon.control(project_dir=args.project_dir, command="status"):
+
+        if process.poll() is not None or \
+                time.monotonic() - started > daemon.STARTUP_TIMEOUT:
+            raise RuntimeError(f"Failed to start the daemon, see '{log}'")
+
+        time.sleep(0.1)
+
+    print(f"Daemon started for '{args.project_dir}'")
+
+
+def stop(args: Namespace) -> None:
+
+    if not daemon.control(project_dir=args.project_dir, command="stop"):
+        print(f"No daemon running for '{args.project_dir}'")
+        return
+
+    print(f"Daemon stopped for '{args.project_dir}'")
+
+
+def status(args: Namespace) -> None:
+
+    if daemon.control(project_dir=args.project_dir, command="status"):
+        print(f"Daemon running for '{args.project_dir}' "
+              f"({daemon.socket_path(project_dir=args.project_dir)})")
+    else:
+        print(f"No daemon running for '{args.project_dir}'")
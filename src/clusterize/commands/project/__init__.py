@@ -1,4 +1,3 @@
-from . import create
-from . import listprj
-from . import execute
-from . import commands
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["create", "listprj", "execute", "commands"])
@@ -4,13 +4,12 @@ from clusterize import structures, utils
 
 def commands(args: Namespace) -> None:
 
-    project_data = utils.project.get_project_data(args.project_dir)
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
 
-    if project_data is None:
-        raise RuntimeError(f"No project found in '{project_data.directory}'")
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
 
-    with open(file=project_data.project, mode='r') as f:
-        prj: structures.project.Project = structures.project.Project.from_yaml(data=f)
+    prj: structures.project.Project = project_config.project
 
     print(f"Active project: {prj.name}")
     print()
@@ -7,7 +7,9 @@ from tree_format import format_tree
 
 def listprj(args: Namespace) -> None:
 
-    projects = utils.project.find_projects(folder=args.dir)
+    projects = utils.project.find_projects(folder=args.dir,
+                                           recursive=args.recursive,
+                                           max_workers=args.jobs)
 
     if len(projects) == 0:
         print(f"No projects found in '{args.dir}'")
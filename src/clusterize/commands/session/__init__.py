@@ -1 +1,3 @@
-from . import listsess
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["listsess"])
@@ -1,6 +1,166 @@
+import time
+import datetime
 from argparse import Namespace
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+from clusterize.executors import backends
+from clusterize import structures, utils
 
+FIELDS = ['{{.Label "clusterize.session"}}', '{{.Label "clusterize.project"}}',
+          "{{.Names}}", "{{.Image}}", "{{.CreatedAt}}", "{{.Status}}"]
 
-def listsess(args: Namespace):
+# A single query returns all the clusterize containers of a node
+PS_CMD = f"docker ps --filter label=clusterize --format '{chr(9).join(FIELDS)}'"
 
-    raise NotImplementedError
+
+@dataclass
+class SessionContainer:
+
+    host: str
+    session: str
+    project: str
+    name: str
+    image: str
+    # The raw docker output if its format is not recognized
+    created: Union[datetime.datetime, str]
+    status: str
+
+
+def parse_created(created: str) -> Union[datetime.datetime, str]:
+
+    # Docker prints e.g. '2021-01-31 10:20:30 +0100 CET'
+    try:
+        date, hour, offset = created.split()[:3]
+        return datetime.datetime.strptime(f"{date} {hour} {offset}",
+                                          "%Y-%m-%d %H:%M:%S %z")
+    except ValueError:
+        return created.strip()
+
+
+def parse_ps(host: str, stdout: str) -> List[SessionContainer]:
+
+    containers = []
+
+    for line in stdout.splitlines():
+
+        fields = line.split("\t")
+
+        if len(fields) != len(FIELDS):
+            continue
+
+        session, project, name, image, created, status = fields
+
+        containers.append(SessionContainer(host=host,
+                                           # Sessions started without a label
+                                           session=session if session else name,
+                                           project=project,
+                                           name=name,
+                                           image=image,
+                                           created=parse_created(created=created),
+                                           status=status))
+
+    return containers
+
+
+def query_sessions(cluster: structures.cluster.Cluster) \
+        -> Tuple[List[SessionContainer], List[str]]:
+
+    runner = backends.cluster_runner(cluster=cluster, parallel=True)
+    outcomes = runner.run_outcomes(cmd=PS_CMD, on="CLUSTER")
+
+    containers = []
+    unreachable = []
+
+    for host, outcome in outcomes.items():
+
+        if outcome.failed:
+            unreachable.append(host)
+            continue
+
+        containers += parse_ps(host=host, stdout=outcome.result.stdout)
+
+    return containers, unreachable
+
+
+def format_uptime(seconds: float) -> str:
+
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+
+    if days != 0:
+        return f"{days}d {hours}h"
+
+    return f"{hours}h {minutes:02d}m"
+
+
+def sessions_table(containers: List[SessionContainer]) -> List[List[str]]:
+
+    sessions: Dict[Tuple[str, str], List[SessionContainer]] = {}
+
+    for container in containers:
+        sessions.setdefault((container.project, container.session), []).append(container)
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    rows = [["SESSION", "PROJECT", "NODES", "CONTAINERS", "UPTIME", "IMAGE"]]
+
+    for (project, session), session_containers in sorted(sessions.items()):
+
+        created = [c.created for c in session_containers
+                   if isinstance(c.created, datetime.datetime)]
+
+        if len(created) != 0:
+            uptime = format_uptime(seconds=(now - min(created)).total_seconds())
+        else:
+            uptime = session_containers[0].created
+
+        rows.append([session,
+                     project,
+                     str(len({c.host for c in session_containers})),
+                     str(len(session_containers)),
+                     uptime,
+                     ", ".join(sorted({c.image for c in session_containers}))])
+
+    return rows
+
+
+def print_table(rows: List[List[str]]) -> None:
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+def print_sessions(cluster: structures.cluster.Cluster) -> None:
+
+    containers, unreachable = query_sessions(cluster=cluster)
+
+    if len(containers) == 0:
+        print("No active sessions found.")
+    else:
+        print_table(rows=sessions_table(containers=containers))
+
+    if len(unreachable) != 0:
+        print(f"\nUnreachable nodes: [{', '.join(unreachable)}]")
+
+
+def listsess(args: Namespace) -> None:
+
+    project_config = utils.project.get_project_config(project_folder=args.project_dir)
+
+    if project_config is None:
+        raise RuntimeError(f"No project found in '{args.project_dir}'")
+
+    if args.watch is None:
+        print_sessions(cluster=project_config.cluster)
+        return
+
+    try:
+        while True:
+            # Clear the terminal before refreshing the table
+            print("\033[2J\033[H", end="")
+            print_sessions(cluster=project_config.cluster)
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
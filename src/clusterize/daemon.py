@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import traceback
+import contextlib
+from pathlib import Path
+from typing import IO, Dict, List, Optional
+from clusterize.utils import config
+
+# Interactive commands forwarded to the daemon of their project, if running
+DAEMON_COMMANDS = [("cluster", "execute"), ("cluster", "topology"), ("session", "list")]
+
+# Set to run every command in the CLI process, even if a daemon is running
+NO_DAEMON_ENV_VAR = "CLUSTERIZE_NO_DAEMON"
+
+# Environment of the client that the forwarded commands depend on
+FORWARDED_ENV_VARS = ["CLUSTERIZE_EXECUTOR", "XDG_CACHE_HOME", "SSH_AUTH_SOCK"]
+
+# Seconds without requests after which the daemon exits
+DEFAULT_IDLE_TIMEOUT = 3600.0
+
+# Seconds waited for a new daemon to accept requests
+STARTUP_TIMEOUT = 30.0
+
+
+def socket_path(project_dir: str) -> Path:
+
+    # One daemon per user (cache dir) and per project (hash of its directory)
+    project_dir = str(Path(project_dir).expanduser().resolve())
+    name = hashlib.sha256(project_dir.encode()).hexdigest()[:16]
+
+    return config.user_cache_dir() / "daemon" / f"{name}.sock"
+
+
+def log_path(project_dir: str) -> Path:
+
+    return socket_path(project_dir=project_dir).with_suffix(".log")
+
+
+def connect(project_dir: str) -> Optional[socket.socket]:
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        client.connect(str(socket_path(project_dir=project_dir)))
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+
+    return client
+
+
+def request(client: socket.socket, message: dict, out: IO, err: IO) -> Optional[int]:
+
+    client.sendall((json.dumps(message) + "\n").encode())
+
+    # The daemon streams the output of the command and then its exit code
+    for line in client.makefile(mode='r', encoding="utf-8"):
+
+        frame = json.loads(line)
+
+        # Another command is running, the client runs this one by itself
+        if frame.get("busy", False):
+            return None
+
+        if "exit" in frame:
+            return frame["exit"]
+
+        stream = out if frame["stream"] == "out" else err
+        stream.write(frame["data"])
+        stream.flush()
+
+    raise RuntimeError("The daemon closed the connection before the end of the command")
+
+
+def forward(argv: List[str]) -> Optional[int]:
+
+    if os.environ.get(NO_DAEMON_ENV_VAR, "") != "":
+        return None
+
+    if len(argv) < 4 or tuple(argv[1:3]) not in DAEMON_COMMANDS:
+        return None
+
+    # The watch mode would keep the daemon busy forever
+    if "--watch" in argv or argv[3].startswith("-"):
+        return None
+
+    client = connect(project_dir=argv[3])
+
+    # Fall back to run the command directly
+    if client is None:
+        return None
+
+    with client:
+        return request(client=client,
+                       message=dict(argv=argv,
+                                    cwd=os.getcwd(),
+                                    env={name: os.environ.get(name, None)
+                                         for name in FORWARDED_ENV_VARS}),
+                       out=sys.stdout,
+                       err=sys.stderr)
+
+
+def update_environ(env: Dict[str, Optional[str]]) -> None:
+
+    for name, value in env.items():
+
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+class SocketStream:
+
+    def __init__(self,
+                 connection: socket.socket,
+                 name: str,
+                 lock: threading.Lock,
+                 disconnected: threading.Event):
+
+        self.name = name
+
+        self._lock = lock
+        self._connection = connection
+        self._disconnected = disconnected
+
+    def write(self, data: str) -> int:
+
+        frame = json.dumps(dict(stream=self.name, data=data)) + "\n"
+
+        with self._lock:
+
+            # The client went away (e.g. Ctrl-C), abort the command instead of
+            # keeping the daemon busy with output nobody reads
+            if self._disconnected.is_set():
+                raise BrokenPipeError("The client of the daemon disconnected")
+
+            try:
+                self._connection.sendall(frame.encode())
+            except OSError:
+                self._disconnected.set()
+                raise BrokenPipeError("The client of the daemon disconnected")
+
+        return len(data)
+
+    def flush(self) -> None:
+
+        pass
+
+    def isatty(self) -> bool:
+
+        return False
+
+
+class Daemon:
+
+    def __init__(self, project_dir: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+
+        self.project_dir = str(Path(project_dir).expanduser().resolve())
+        self.idle_timeout = idle_timeout
+
+        self._running = True
+        self._last_request = time.monotonic()
+
+        # The commands change the process-wide argv, cwd, environment and stdout,
+        # hence they are served one at a time
+        self._command_lock = threading.Lock()
+
+    def warm_up(self) -> None:
+
+        from clusterize import utils
+        from clusterize.executors import backends
+
+        with self._command_lock:
+
+            project_config = utils.project.get_project_config(
+                project_folder=self.project_dir)
+
+            if project_config is None:
+                raise RuntimeError(f"No project found in '{self.project_dir}'")
+
+            # Open the connections to all the nodes, they stay open for the
+            # following requests
+            runner = backends.cluster_runner(cluster=project_config.cluster,
+                                             parallel=True)
+            _ = runner.run_outcomes(cmd="true", on="CLUSTER")
+
+    def run_command(self,
+                    connection: socket.socket,
+                    argv: List[str],
+                    cwd: str,
+                    env: Dict[str, Optional[str]]) -> Optional[int]:
+
+        from clusterize import cli
+
+        lock = threading.Lock()
+        disconnected = threading.Event()
+        out = SocketStream(connection=connection, name="out", lock=lock,
+                           disconnected=disconnected)
+        err = SocketStream(connection=connection, name="err", lock=lock,
+                           disconnected=disconnected)
+
+        # Requests do not queue behind a running command, the clients run the
+        # command by themselves instead
+        if not self._command_lock.acquire(blocking=False):
+            return None
+
+        try:
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+
+                # Run with the environment of the client, e.g. the executor it selected
+                env = {name: env.get(name, None) for name in FORWARDED_ENV_VARS}
+                previous_env = {name: os.environ.get(name, None) for name in env}
+
+                previous_argv, previous_cwd = sys.argv, os.getcwd()
+                sys.argv = argv
+                os.chdir(cwd)
+                update_environ(env=env)
+
+                try:
+                    cli.CmdLineParser().parse()
+                    code = 0
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else int(e.code is not None)
+                except Exception:
+                    if not disconnected.is_set():
+                        traceback.print_exc()
+                    code = 1
+                finally:
+                    sys.argv = previous_argv
+                    os.chdir(previous_cwd)
+                    update_environ(env=previous_env)
+        finally:
+            self._command_lock.release()
+
+        return code
+
+    @staticmethod
+    def send(connection: socket.socket, **frame) -> None:
+
+        try:
+            connection.sendall((json.dumps(frame) + "\n").encode())
+        except OSError:
+            pass
+
+    def handle(self, connection: socket.socket) -> None:
+
+        with connection:
+
+            line = connection.makefile(mode='r', encoding="utf-8", errors="replace") \
+                .readline()
+
+            if line == "":
+                return
+
+            try:
+                message = json.loads(line)
+                control = message.get("control", None)
+
+                if control not in (None, "stop", "status"):
+                    raise ValueError(f"unknown control '{control}'")
+
+                if control is None:
+                    argv, cwd = message["argv"], message["cwd"]
+                    env = message.get("env", {})
+
+                    if not isinstance(argv, list) or not isinstance(cwd, str) \
+                            or not isinstance(env, dict):
+                        raise TypeError("expected a list argv, a str cwd and a dict env")
+
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                # Report the cause instead of just closing the connection
+                Daemon.send(connection=connection, stream="err",
+                            data=f"Malformed request to the daemon: {e!r}\n")
+                Daemon.send(connection=connection, exit=2)
+                return
+
+            if control == "stop":
+                self._running = False
+                code = 0
+            elif control == "status":
+                code = 0
+            else:
+                code = self.run_command(connection=connection,
+                                        argv=argv,
+                                        cwd=cwd,
+                                        env=env)
+
+            if code is None:
+                Daemon.send(connection=connection, busy=True)
+            else:
+                Daemon.send(connection=connection, exit=code)
+
+            self._last_request = time.monotonic()
+
+    def serve(self) -> None:
+
+        path = socket_path(project_dir=self.project_dir)
+
+        # The socket gives access to the cluster, only the user can reach it
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        client = connect(project_dir=self.project_dir)
+
+        if client is not None:
+            client.close()
+            raise RuntimeError(f"A daemon is already serving '{self.project_dir}'")
+
+        # Left by a daemon that did not exit cleanly
+        if path.exists():
+            path.unlink()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(path))
+        server.listen()
+        server.settimeout(1.0)
+
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+        try:
+            while self._running:
+
+                if time.monotonic() - self._last_request > self.idle_timeout:
+                    break
+
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+
+                connection.settimeout(None)
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+        finally:
+            server.close()
+            path.unlink()
+
+
+def control(project_dir: str, command: str) -> bool:
+
+    client = connect(project_dir=project_dir)
+
+    if client is None:
+        return False
+
+    with client:
+        _ = request(client=client, message=dict(control=command),
+                    out=sys.stdout, err=sys.stderr)
+
+    return True
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(
+        description="Serve the interactive commands of a project.")
+
+    parser.add_argument(
+        "project_dir", metavar="DIR", type=str,
+        help="The directory of the project")
+
+    parser.add_argument(
+        "--idle-timeout", metavar="SECONDS", type=float, default=DEFAULT_IDLE_TIMEOUT,
+        help="Exit after SECONDS without requests (default: %(default)s)")
+
+    args = parser.parse_args()
+
+    Daemon(project_dir=args.project_dir, idle_timeout=args.idle_timeout).serve()
+
+
+if __name__ == "__main__":
+    main()
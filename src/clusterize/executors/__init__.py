@@ -1,2 +1,7 @@
 from . import base
 from . import ssh
+from . import transfer
+from . import pipeline
+from . import batch
+from . import backends
+from . import output
@@ -0,0 +1,430 @@
+import json
+import time
+import queue
+import atexit
+import base64
+import fabric
+import hashlib
+import threading
+from . import base
+from . import ssh
+from . import output
+from . import transfer
+from pathlib import Path
+from clusterize import structures
+from clusterize.utils import tracing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+AGENT_PYTHON = "python3"
+
+DEFAULT_MAX_CONCURRENCY = 256
+
+# Size of the chunks of the files sent to the agents
+PUT_CHUNK_SIZE = 1024 * 1024
+
+# Seconds waited for the agent to report a command completed after its timeout
+AGENT_TIMEOUT_MARGIN = 10.0
+
+
+def agent_source() -> Path:
+
+    return Path(__file__).parent.parent / "agent.py"
+
+
+def agent_remote_path() -> str:
+
+    # Nodes running a different version of the agent get the new one installed
+    # side by side
+    digest = hashlib.sha256(agent_source().read_bytes()).hexdigest()[:12]
+    return f".clusterize_agent_{digest}.py"
+
+
+class AgentConnection:
+
+    def __init__(self, node_info: ssh.NodeConnectionInfo):
+
+        self.node_info = node_info
+
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._pending: Dict[int, queue.Queue] = {}
+        self._channel = None
+        self._reader = None
+        self._closed = False
+
+    def open(self) -> None:
+
+        connection = ssh.connection_pool.connection(node_info=self.node_info)
+
+        with tracing.tracer.span(name="agent", category="ssh", host=self.node_info.ip):
+
+            hello = self._start(connection=connection)
+
+            # Install the agent the first time it is used in the node
+            if hello is None:
+                connection.put(local=str(agent_source()), remote=agent_remote_path())
+                hello = self._start(connection=connection)
+
+        if hello is None:
+            raise RuntimeError(f"Failed to start the agent in '{self.node_info.ip}'")
+
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _start(self, connection: fabric.Connection) -> Any:
+
+        connection.open()
+
+        # A single channel carries all the requests to the node
+        self._channel = connection.client.get_transport().open_session()
+        self._channel.exec_command(f"{AGENT_PYTHON} -u {agent_remote_path()}")
+
+        self._reader = self._channel.makefile("r")
+        line = self._reader.readline()
+
+        if not line:
+            self._channel.close()
+            return None
+
+        return json.loads(line)
+
+    def _read(self) -> None:
+
+        error = f"Connection to the agent in '{self.node_info.ip}' lost"
+        invalid = False
+
+        try:
+            for line in self._reader:
+
+                frame = json.loads(line)
+
+                if not isinstance(frame, dict):
+                    raise ValueError(f"Unexpected frame {line!r}")
+
+                with self._lock:
+                    pending = self._pending.get(frame.get("id", None), None)
+
+                if pending is not None:
+                    pending.put(frame)
+
+        except ValueError as e:
+            error = f"Invalid frame from the agent in '{self.node_info.ip}': {e}"
+            invalid = True
+
+        finally:
+            # The channel is closed, the pending requests will never complete
+            with self._lock:
+
+                self._closed = True
+
+                for pending in self._pending.values():
+                    pending.put(dict(error=error))
+
+        # The following frames could not be trusted either
+        if invalid:
+            self.close()
+
+    @property
+    def closed(self) -> bool:
+
+        return self._closed
+
+    def request(self, **message) -> Tuple[int, queue.Queue]:
+
+        with self._lock:
+
+            if self._closed:
+                raise RuntimeError(f"Connection to the agent in "
+                                   f"'{self.node_info.ip}' lost")
+
+            self._next_id += 1
+            message["id"] = self._next_id
+            self._pending[message["id"]] = queue.Queue()
+
+            # Sending under the lock keeps the frames whole
+            self._channel.sendall((json.dumps(message) + "\n").encode())
+
+            return message["id"], self._pending[message["id"]]
+
+    def done(self, request_id: int) -> None:
+
+        with self._lock:
+            self._pending.pop(request_id, None)
+
+    def call(self, timeout: float = None, **message) -> Dict[str, Any]:
+
+        request_id, pending = self.request(**message)
+
+        try:
+            frame = pending.get(timeout=timeout)
+        finally:
+            self.done(request_id=request_id)
+
+        if "error" in frame:
+            raise RuntimeError(frame["error"])
+
+        return frame["result"]
+
+    def run(self,
+            cmd: str,
+            timeout: float = None,
+            out: output.HostOutput = None,
+            err: output.HostOutput = None) -> Dict[str, Any]:
+
+        request_id, pending = self.request(op="run", cmd=cmd, timeout=timeout)
+        buffers = {"out": [], "err": []}
+        streams = {"out": out, "err": err}
+
+        wait = None if timeout is None else timeout + AGENT_TIMEOUT_MARGIN
+
+        try:
+            while True:
+
+                frame = pending.get(timeout=wait)
+
+                if "error" in frame:
+                    raise RuntimeError(frame["error"])
+
+                if "exit" in frame:
+                    return dict(stdout="".join(buffers["out"]),
+                                stderr="".join(buffers["err"]),
+                                exited=frame["exit"],
+                                timed_out=frame["timed_out"])
+
+                buffers[frame["stream"]].append(frame["data"])
+
+                if streams[frame["stream"]] is not None:
+                    streams[frame["stream"]].write(frame["data"])
+
+        except queue.Empty:
+            # The agent did not stop the command in time, do not leave it running
+            self.cancel(request_id=request_id)
+            raise
+
+        finally:
+            for stream in streams.values():
+                if stream is not None:
+                    stream.close()
+
+            self.done(request_id=request_id)
+
+    def cancel(self, request_id: int) -> None:
+
+        try:
+            cancel_id, _ = self.request(op="kill", target=request_id)
+        except Exception:
+            return
+
+        # The reply is not awaited
+        self.done(request_id=cancel_id)
+
+    def put(self, local: str, remote: str) -> None:
+
+        data = Path(local).read_bytes()
+        mode = Path(local).stat().st_mode & 0o777
+
+        for offset in range(0, max(len(data), 1), PUT_CHUNK_SIZE):
+
+            chunk = data[offset:offset + PUT_CHUNK_SIZE]
+
+            _ = self.call(op="put",
+                          path=remote,
+                          offset=offset,
+                          data=base64.b64encode(chunk).decode(),
+                          mode=mode)
+
+    def stats(self) -> Dict[str, Any]:
+
+        return self.call(op="stats")
+
+    def close(self) -> None:
+
+        # Both the pool and the reader thread can close the connection
+        channel, self._channel = self._channel, None
+
+        if channel is None:
+            return
+
+        try:
+            channel.sendall((json.dumps(dict(op="exit")) + "\n").encode())
+        except Exception:
+            pass
+
+        channel.close()
+
+
+class AgentPool:
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}
+        self._agents: Dict[str, AgentConnection] = {}
+
+    def agent(self, node_info: ssh.NodeConnectionInfo) -> AgentConnection:
+
+        with self._lock:
+            host_lock = self._host_locks.setdefault(node_info.ip, threading.Lock())
+
+        # Concurrent users of the same node wait for a single agent
+        with host_lock:
+
+            agent = self._agents.get(node_info.ip, None)
+
+            if agent is None or agent.closed:
+                agent = AgentConnection(node_info=node_info)
+                agent.open()
+                self._agents[node_info.ip] = agent
+
+            return agent
+
+    def close(self) -> None:
+
+        with self._lock:
+
+            for agent in self._agents.values():
+                agent.close()
+
+            self._agents.clear()
+
+
+# Agents are shared by all the runners of the same CLI invocation
+agent_pool = AgentPool()
+atexit.register(agent_pool.close)
+
+
+def run_node(node_info: ssh.NodeConnectionInfo,
+             cmd: str,
+             timeout: float = base.DEFAULT_TIMEOUT,
+             print_output: bool = False,
+             multiplexer: output.OutputMultiplexer = None,
+             phase: str = None) -> base.HostOutcome:
+
+    outcome = base.HostOutcome(host=node_info.ip)
+    connection = fabric.Connection(host=node_info.ip, user=node_info.username)
+
+    started = time.monotonic()
+
+    out, err = None, None
+
+    if print_output and multiplexer is not None:
+        out = multiplexer.stdout(host=node_info.ip)
+        err = multiplexer.stderr(host=node_info.ip)
+
+    try:
+        with tracing.tracer.span(name="command", category="agent", host=node_info.ip,
+                                 phase=phase, cmd=cmd):
+            completed = agent_pool.agent(node_info=node_info).run(cmd=cmd,
+                                                                  timeout=timeout,
+                                                                  out=out,
+                                                                  err=err)
+    except queue.Empty:
+        outcome.timed_out = True
+        completed = None
+    except Exception as e:
+        outcome.exception = e
+        completed = None
+
+    outcome.elapsed = time.monotonic() - started
+
+    if completed is None:
+        outcome.result = fabric.Result(connection=connection, command=cmd, exited=-1)
+        return outcome
+
+    outcome.timed_out = completed["timed_out"]
+    outcome.result = fabric.Result(
+        connection=connection,
+        command=cmd,
+        stdout=completed["stdout"],
+        stderr=completed["stderr"],
+        exited=-1 if completed["timed_out"] else completed["exited"],
+        hide=() if print_output else ("stdout", "stderr"))
+
+    return outcome
+
+
+def put_in_host(node_info: ssh.NodeConnectionInfo,
+                transfers: List[transfer.FileTransfer],
+                phase: str = None) -> None:
+
+    agent = agent_pool.agent(node_info=node_info)
+
+    for t in transfers:
+        with tracing.tracer.span(name="put", category="agent", host=node_info.ip,
+                                 phase=phase, remote=t.remote):
+            agent.put(local=t.local, remote=t.remote)
+
+
+def put_in_hosts(group_info: ssh.GroupConnectionInfo,
+                 transfers: List[transfer.FileTransfer],
+                 max_transfers: int = transfer.DEFAULT_MAX_TRANSFERS) -> None:
+
+    nodes_info = [ssh.NodeConnectionInfo(ip=ip,
+                                         username=group_info.username,
+                                         ssh_private_key=group_info.ssh_private_key)
+                  for ip in group_info.ips]
+
+    if len(nodes_info) == 0:
+        return
+
+    phase = tracing.tracer.phase
+
+    with ThreadPoolExecutor(max_workers=max_transfers) as executor:
+
+        futures = [executor.submit(put_in_host, node_info, transfers, phase)
+                   for node_info in nodes_info]
+
+        # Re-raise the first failed transfer, if any
+        for future in futures:
+            future.result()
+
+
+def stats(group_info: ssh.GroupConnectionInfo,
+          max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+
+    nodes_info = [ssh.NodeConnectionInfo(ip=ip,
+                                         username=group_info.username,
+                                         ssh_private_key=group_info.ssh_private_key)
+                  for ip in group_info.ips]
+
+    if len(nodes_info) == 0:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(len(nodes_info), max_concurrency)) as executor:
+
+        futures = {
+            node_info.ip: executor.submit(
+                lambda n: agent_pool.agent(node_info=n).stats(), node_info)
+            for node_info in nodes_info}
+
+        # Nodes whose agent cannot be reached are not reported
+        return {ip: future.result() for ip, future in futures.items()
+                if future.exception() is None}
+
+
+class AgentClusterCommandRunner(base.NodesCommandRunner):
+
+    def __init__(self,
+                 cluster: structures.cluster.Cluster,
+                 parallel: bool = False,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 multiplexer: output.OutputMultiplexer = None):
+
+        super().__init__(cluster=cluster,
+                         max_concurrency=max_concurrency if parallel else 1,
+                         multiplexer=multiplexer)
+
+    def _run_node(self,
+                  node_info: ssh.NodeConnectionInfo,
+                  cmd: str,
+                  timeout: float = base.DEFAULT_TIMEOUT,
+                  print_output: bool = False,
+                  multiplexer: output.OutputMultiplexer = None,
+                  phase: str = None) -> base.HostOutcome:
+
+        return run_node(node_info=node_info,
+                        cmd=cmd,
+                        timeout=timeout,
+                        print_output=print_output,
+                        multiplexer=multiplexer,
+                        phase=phase)
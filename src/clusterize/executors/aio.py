@@ -0,0 +1,222 @@
+import time
+import atexit
+import fabric
+import asyncio
+import threading
+from . import base
+from . import ssh
+from . import output
+from clusterize import structures
+from typing import Dict, List, Tuple
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+DEFAULT_MAX_CONCURRENCY = 256
+
+# Size of the chunks of output read from the commands
+READ_SIZE = 64 * 1024
+
+
+class AsyncConnectionPool:
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._connections: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+
+        with self._lock:
+
+            # The loop runs in a background thread so that it can be fed by
+            # multiple threads at the same time (e.g. the pipelined start)
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                daemon=True)
+                self._thread.start()
+
+            return self._loop
+
+    def run_until_complete(self, coroutine):
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def connection(self, node_info: ssh.NodeConnectionInfo) \
+            -> "asyncssh.SSHClientConnection":
+
+        key = (node_info.ip, node_info.username, node_info.ssh_private_key)
+
+        # Store the pending connection so that concurrent users share the handshake
+        if key not in self._connections:
+
+            client_keys = None if node_info.ssh_private_key == str(None) \
+                else [node_info.ssh_private_key]
+
+            # Like fabric, accept unknown host keys
+            self._connections[key] = asyncio.ensure_future(asyncssh.connect(
+                host=node_info.ip,
+                username=node_info.username,
+                client_keys=client_keys,
+                known_hosts=None))
+
+        try:
+            return await self._connections[key]
+        except Exception:
+            self._connections.pop(key, None)
+            raise
+
+    def close(self) -> None:
+
+        if self._loop is None:
+            return
+
+        async def close_connections():
+
+            for future in self._connections.values():
+
+                if future.done() and future.exception() is None:
+                    future.result().close()
+                    await future.result().wait_closed()
+
+        self.run_until_complete(close_connections())
+        self._connections.clear()
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+        self._loop = None
+        self._thread = None
+
+
+# Connections are shared by all the runners of the same CLI invocation
+connection_pool = AsyncConnectionPool()
+atexit.register(connection_pool.close)
+
+
+class AsyncClusterCommandRunner(base.NodesCommandRunner):
+
+    def __init__(self,
+                 cluster: structures.cluster.Cluster,
+                 parallel: bool = False,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 multiplexer: output.OutputMultiplexer = None):
+
+        super().__init__(cluster=cluster,
+                         max_concurrency=max_concurrency if parallel else 1,
+                         multiplexer=multiplexer)
+
+        if asyncssh is None:
+            raise RuntimeError("The asyncio executor requires the 'asyncssh' package")
+
+    def _run_nodes(self,
+                   nodes_info: List[ssh.NodeConnectionInfo],
+                   cmd: str,
+                   timeout: float = base.DEFAULT_TIMEOUT,
+                   print_output: bool = False) -> List[base.HostOutcome]:
+
+        return connection_pool.run_until_complete(self._run_nodes_async(
+            nodes_info=nodes_info, cmd=cmd, timeout=timeout, print_output=print_output))
+
+    async def _run_nodes_async(self,
+                               nodes_info: List[ssh.NodeConnectionInfo],
+                               cmd: str,
+                               timeout: float = base.DEFAULT_TIMEOUT,
+                               print_output: bool = False) -> List[base.HostOutcome]:
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        multiplexer = self._multiplexer
+
+        if print_output and multiplexer is None:
+            multiplexer = output.OutputMultiplexer()
+
+        async def read(reader: "asyncssh.SSHReader",
+                       chunks: List[str],
+                       stream: output.HostOutput = None) -> None:
+
+            # The output is printed as it arrives, not when the command completes
+            while True:
+
+                data = await reader.read(READ_SIZE)
+
+                if data == "":
+                    return
+
+                chunks.append(data)
+
+                if stream is not None:
+                    stream.write(data)
+
+        async def run_process(ssh_connection: "asyncssh.SSHClientConnection",
+                              host: str) -> Tuple[str, str, int]:
+
+            stdout, stderr = [], []
+            streams = (None, None) if not print_output else \
+                (multiplexer.stdout(host=host), multiplexer.stderr(host=host))
+
+            process = await ssh_connection.create_process(cmd)
+            process.stdin.write_eof()
+
+            try:
+                await asyncio.gather(read(process.stdout, stdout, streams[0]),
+                                     read(process.stderr, stderr, streams[1]))
+                await process.wait_closed()
+            finally:
+                process.close()
+
+                for stream in streams:
+                    if stream is not None:
+                        stream.close()
+
+            exited = process.exit_status if process.exit_status is not None else -1
+            return "".join(stdout), "".join(stderr), exited
+
+        async def run_node(node_info: ssh.NodeConnectionInfo) -> base.HostOutcome:
+
+            outcome = base.HostOutcome(host=node_info.ip)
+            connection = fabric.Connection(host=node_info.ip, user=node_info.username)
+
+            async with semaphore:
+
+                started = time.monotonic()
+
+                try:
+                    ssh_connection = await connection_pool.connection(node_info=node_info)
+                    completed = await asyncio.wait_for(
+                        run_process(ssh_connection=ssh_connection, host=node_info.ip),
+                        timeout=timeout)
+                except asyncio.TimeoutError:
+                    outcome.timed_out = True
+                    completed = None
+                except Exception as e:
+                    outcome.exception = e
+                    completed = None
+
+                outcome.elapsed = time.monotonic() - started
+
+            if completed is None:
+                outcome.result = fabric.Result(connection=connection, command=cmd,
+                                               exited=-1)
+                return outcome
+
+            stdout, stderr, exited = completed
+
+            outcome.result = fabric.Result(
+                connection=connection,
+                command=cmd,
+                stdout=stdout,
+                stderr=stderr,
+                exited=exited,
+                hide=() if print_output else ("stdout", "stderr"))
+
+            return outcome
+
+        return list(await asyncio.gather(*[run_node(n) for n in nodes_info]))
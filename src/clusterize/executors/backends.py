@@ -0,0 +1,55 @@
+import os
+from . import base
+from . import output
+from clusterize import structures
+
+# Environment variable selecting the executor used by the cluster commands
+EXECUTOR_ENV_VAR = "CLUSTERIZE_EXECUTOR"
+DEFAULT_EXECUTOR = "ssh"
+
+
+def executor_name() -> str:
+
+    return os.environ.get(EXECUTOR_ENV_VAR, DEFAULT_EXECUTOR)
+
+
+def cluster_runner(cluster: structures.cluster.Cluster,
+                   parallel: bool = False,
+                   executor: str = None,
+                   multiplexer: output.OutputMultiplexer = None) \
+        -> base.CommandClusterRunner:
+
+    if executor is None:
+        executor = executor_name()
+
+    if executor == "ssh":
+        from . import ssh
+        return ssh.SSHClusterCommandRunner(cluster=cluster,
+                                           parallel=parallel,
+                                           multiplexer=multiplexer)
+
+    if executor == "asyncio":
+        from . import aio
+        return aio.AsyncClusterCommandRunner(cluster=cluster,
+                                             parallel=parallel,
+                                             multiplexer=multiplexer)
+
+    if executor == "openssh":
+        from . import openssh
+        return openssh.OpenSSHClusterCommandRunner(cluster=cluster,
+                                                   parallel=parallel,
+                                                   multiplexer=multiplexer)
+
+    if executor == "agent":
+        from . import agent
+        return agent.AgentClusterCommandRunner(cluster=cluster,
+                                               parallel=parallel,
+                                               multiplexer=multiplexer)
+
+    if executor == "relay":
+        from . import relay
+        return relay.RelayClusterCommandRunner(cluster=cluster,
+                                               parallel=parallel,
+                                               multiplexer=multiplexer)
+
+    raise ValueError(f"Executor '{executor}' not recognized")
@@ -1,7 +1,135 @@
 import abc
+import time
+import invoke
 import fabric
+import statistics
+from . import output
+from dataclasses import dataclass
+from contextlib import contextmanager
+from clusterize import structures
+from clusterize.utils import tracing
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, ContextManager, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from . import ssh
 
 DEFAULT_TIMEOUT = 30.0
+DEFAULT_STRAGGLER_FACTOR = 2.0
+
+
+@dataclass
+class HostOutcome:
+
+    host: str
+    result: fabric.Result = None
+    exception: BaseException = None
+    timed_out: bool = False
+    attempts: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> bool:
+
+        if self.timed_out or self.exception is not None or self.result is None:
+            return True
+
+        return self.result.failed
+
+
+@dataclass
+class RetryPolicy:
+
+    # Number of additional attempts on the hosts that failed or timed out
+    retries: int = 0
+    # Seconds to wait before the first retry, doubled at every further retry
+    backoff: float = 1.0
+    # Maximum duration in seconds of all the attempts (None for no deadline)
+    deadline: float = None
+
+
+RunAttemptCallable = Callable[[List[str], Optional[float]], Dict[str, HostOutcome]]
+RunNodesCallable = Callable[[List["ssh.NodeConnectionInfo"], Optional[float]],
+                            List[HostOutcome]]
+
+
+def run_with_retries(run_attempt: RunAttemptCallable,
+                     hosts: List[str],
+                     timeout: float = DEFAULT_TIMEOUT,
+                     policy: RetryPolicy = None) -> Dict[str, HostOutcome]:
+
+    if policy is None:
+        policy = RetryPolicy()
+
+    started = time.monotonic()
+    outcomes = {host: HostOutcome(host=host, timed_out=True) for host in hosts}
+
+    pending = list(hosts)
+
+    for attempt in range(policy.retries + 1):
+
+        if len(pending) == 0:
+            break
+
+        if attempt > 0:
+
+            backoff = policy.backoff * 2 ** (attempt - 1)
+
+            if policy.deadline is not None:
+                backoff = min(backoff, policy.deadline - (time.monotonic() - started))
+
+            time.sleep(max(backoff, 0))
+
+        attempt_timeout = timeout
+
+        # Cut the timeout of the attempt so that it cannot outlive the deadline
+        if policy.deadline is not None:
+
+            remaining = policy.deadline - (time.monotonic() - started)
+
+            if remaining <= 0:
+                break
+
+            attempt_timeout = remaining if timeout is None else min(timeout, remaining)
+
+        for host, outcome in run_attempt(pending, attempt_timeout).items():
+            outcome.attempts = attempt + 1
+            outcomes[host] = outcome
+
+        pending = [host for host in pending if outcomes[host].failed]
+
+    return outcomes
+
+
+def run_nodes_with_retries(run_nodes: RunNodesCallable,
+                           nodes_info: List["ssh.NodeConnectionInfo"],
+                           timeout: float = DEFAULT_TIMEOUT,
+                           policy: RetryPolicy = None) -> Dict[str, HostOutcome]:
+
+    nodes = {node_info.ip: node_info for node_info in nodes_info}
+
+    def run_attempt(attempt_hosts: List[str], attempt_timeout: float) \
+            -> Dict[str, HostOutcome]:
+
+        outcomes = run_nodes([nodes[host] for host in attempt_hosts], attempt_timeout)
+        return {outcome.host: outcome for outcome in outcomes}
+
+    return run_with_retries(run_attempt=run_attempt,
+                            hosts=list(nodes),
+                            timeout=timeout,
+                            policy=policy)
+
+
+def stragglers(outcomes: Dict[str, HostOutcome],
+               factor: float = DEFAULT_STRAGGLER_FACTOR) -> List[str]:
+
+    if len(outcomes) < 2:
+        return []
+
+    median = statistics.median(o.elapsed for o in outcomes.values())
+
+    return [host for host, outcome in outcomes.items()
+            if outcome.timed_out or outcome.elapsed > factor * median]
 
 
 class CommandRunner(abc.ABC):
@@ -57,3 +185,218 @@ class CommandClusterRunner(abc.ABC):
                        print_output: bool = False,
                        allow_failures: bool = True) -> fabric.GroupResult:
         pass
+
+    @abc.abstractmethod
+    def run_outcomes(self,
+                     cmd: str,
+                     on: str = "CLUSTER",
+                     timeout: float = DEFAULT_TIMEOUT,
+                     print_output: bool = False,
+                     policy: RetryPolicy = None,
+                     hosts: List[str] = None) -> Dict[str, HostOutcome]:
+        pass
+
+
+def result_from_outcome(outcome: HostOutcome,
+                        timeout: float,
+                        allow_failures: bool) -> fabric.Result:
+
+    if outcome.exception is not None:
+        raise outcome.exception
+
+    if outcome.timed_out:
+        raise invoke.exceptions.CommandTimedOut(outcome.result, timeout=timeout)
+
+    if not allow_failures and outcome.result.failed:
+        raise invoke.exceptions.UnexpectedExit(outcome.result)
+
+    return outcome.result
+
+
+class NodesCommandRunner(CommandClusterRunner, CommandHeadRunner, CommandWorkersRunner):
+
+    # Base of the runners that operate on each node on their own. The backends
+    # implement only the transport, either _run_node or _run_nodes.
+
+    def __init__(self,
+                 cluster: structures.cluster.Cluster,
+                 max_concurrency: int = 1,
+                 multiplexer: output.OutputMultiplexer = None):
+
+        super().__init__()
+
+        self._cluster = cluster
+        self._max_concurrency = max_concurrency
+        self._multiplexer = multiplexer
+
+    def __init_subclass__(cls, **kwargs):
+
+        super().__init_subclass__(**kwargs)
+
+        if cls._run_node is NodesCommandRunner._run_node and \
+                cls._run_nodes is NodesCommandRunner._run_nodes:
+            raise TypeError(
+                f"{cls.__name__} must implement either _run_node or _run_nodes")
+
+    def _run_node(self,
+                  node_info: "ssh.NodeConnectionInfo",
+                  cmd: str,
+                  timeout: float = DEFAULT_TIMEOUT,
+                  print_output: bool = False,
+                  multiplexer: output.OutputMultiplexer = None,
+                  phase: str = None) -> HostOutcome:
+
+        raise NotImplementedError
+
+    def _run_nodes(self,
+                   nodes_info: List["ssh.NodeConnectionInfo"],
+                   cmd: str,
+                   timeout: float = DEFAULT_TIMEOUT,
+                   print_output: bool = False) -> List[HostOutcome]:
+
+        if len(nodes_info) == 0:
+            return []
+
+        multiplexer = self._multiplexer
+
+        if print_output and multiplexer is None:
+            multiplexer = output.OutputMultiplexer()
+
+        # The worker threads do not know the phase of the calling thread
+        phase = tracing.tracer.phase
+
+        max_workers = min(len(nodes_info), self._max_concurrency)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda node_info: self._run_node(node_info=node_info,
+                                                 cmd=cmd,
+                                                 timeout=timeout,
+                                                 print_output=print_output,
+                                                 multiplexer=multiplexer,
+                                                 phase=phase),
+                nodes_info))
+
+    def _nodes_info(self, on: str, hosts: List[str] = None) \
+            -> List["ssh.NodeConnectionInfo"]:
+
+        # Imported here, the ssh module depends on this one
+        from . import ssh
+
+        return ssh.SSHClusterCommandRunner.nodes_connection_info(cluster=self._cluster,
+                                                                 on=on,
+                                                                 hosts=hosts)
+
+    def run_in_head(self,
+                    cmd: str,
+                    timeout: float = DEFAULT_TIMEOUT,
+                    print_output: bool = False,
+                    allow_failures: bool = False) -> fabric.Result:
+
+        outcomes = self._run_nodes(nodes_info=self._nodes_info(on="HEAD"),
+                                   cmd=cmd,
+                                   timeout=timeout,
+                                   print_output=print_output)
+
+        return result_from_outcome(outcome=outcomes[0],
+                                   timeout=timeout,
+                                   allow_failures=allow_failures)
+
+    def run_in_workers(self,
+                       cmd: str,
+                       timeout: float = DEFAULT_TIMEOUT,
+                       print_output: bool = False,
+                       allow_failures: bool = False) -> fabric.GroupResult:
+
+        return self._run_group(on="WORKERS",
+                               cmd=cmd,
+                               timeout=timeout,
+                               print_output=print_output,
+                               allow_failures=allow_failures)
+
+    def run_in_cluster(self,
+                       cmd: str,
+                       timeout: float = DEFAULT_TIMEOUT,
+                       print_output: bool = False,
+                       allow_failures: bool = False) -> fabric.GroupResult:
+
+        return self._run_group(on="CLUSTER",
+                               cmd=cmd,
+                               timeout=timeout,
+                               print_output=print_output,
+                               allow_failures=allow_failures)
+
+    @contextmanager
+    def in_head(self) -> ContextManager[Callable[..., fabric.Result]]:
+
+        yield self.run_in_head
+
+    @contextmanager
+    def in_workers(self) -> ContextManager[Callable[..., fabric.GroupResult]]:
+
+        yield self.run_in_workers
+
+    @contextmanager
+    def in_cluster(self) -> ContextManager[Callable[..., fabric.GroupResult]]:
+
+        yield self.run_in_cluster
+
+    def run_outcomes(self,
+                     cmd: str,
+                     on: str = "CLUSTER",
+                     timeout: float = DEFAULT_TIMEOUT,
+                     print_output: bool = False,
+                     policy: RetryPolicy = None,
+                     hosts: List[str] = None) -> Dict[str, HostOutcome]:
+
+        return run_nodes_with_retries(
+            run_nodes=lambda nodes_info, attempt_timeout: self._run_nodes(
+                nodes_info=nodes_info,
+                cmd=cmd,
+                timeout=attempt_timeout,
+                print_output=print_output),
+            nodes_info=self._nodes_info(on=on, hosts=hosts),
+            timeout=timeout,
+            policy=policy)
+
+    def _run_group(self,
+                   on: str,
+                   cmd: str,
+                   timeout: float = DEFAULT_TIMEOUT,
+                   print_output: bool = False,
+                   allow_failures: bool = False) -> fabric.GroupResult:
+
+        nodes_info = self._nodes_info(on=on)
+        users = {node_info.ip: node_info.username for node_info in nodes_info}
+
+        outcomes = self._run_nodes(nodes_info=nodes_info,
+                                   cmd=cmd,
+                                   timeout=timeout,
+                                   print_output=print_output)
+
+        group_result = fabric.GroupResult()
+        excepted = False
+
+        for outcome in outcomes:
+
+            try:
+                result = result_from_outcome(outcome=outcome,
+                                             timeout=timeout,
+                                             allow_failures=allow_failures)
+            except Exception as e:
+                result = e
+                excepted = True
+
+            # Nodes that failed before running the command have no result
+            if outcome.result is not None:
+                connection = outcome.result.connection
+            else:
+                connection = fabric.Connection(host=outcome.host,
+                                               user=users[outcome.host])
+
+            group_result[connection] = result
+
+        if excepted:
+            raise fabric.exceptions.GroupException(group_result)
+
+        return group_result
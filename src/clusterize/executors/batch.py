@@ -0,0 +1,94 @@
+import shlex
+from typing import List
+from dataclasses import dataclass
+
+MARKER = "__clusterize_step__"
+
+
+@dataclass
+class StepResult:
+
+    command: str
+    exited: int
+    stdout: str
+    started: float
+    finished: float
+
+    @property
+    def failed(self) -> bool:
+
+        return self.exited != 0
+
+    @property
+    def duration(self) -> float:
+
+        return self.finished - self.started
+
+
+def compile_script(commands: List[str]) -> str:
+
+    # Every step runs in a new shell of the user ($SHELL, like the ssh exec of a
+    # separate run()), and it is delimited by markers reporting its index, exit
+    # code and timestamps. Without GNU date (%N), timestamps have 1s resolution.
+    lines = [
+        "__clusterize_now() {",
+        "  __now=$(date +%s.%N)",
+        "  case $__now in *[!0-9.]*) date +%s ;; *) echo \"$__now\" ;; esac",
+        "}",
+        "__clusterize_step() {",
+        f"  printf '\\n{MARKER} begin %s %s\\n' \"$1\" \"$(__clusterize_now)\"",
+        "  \"${SHELL:-/bin/sh}\" -c \"$2\" 2>&1",
+        "  __rc=$?",
+        f"  printf '\\n{MARKER} end %s %s %s\\n' \"$1\" \"$__rc\" "
+        "\"$(__clusterize_now)\"",
+        "  return $__rc",
+        "}",
+    ]
+
+    for idx, cmd in enumerate(commands):
+        lines.append(f"__clusterize_step {idx} {shlex.quote(cmd)} || exit $?")
+
+    return "\n".join(lines)
+
+
+def parse_output(commands: List[str], stdout: str) -> List[StepResult]:
+
+    steps = []
+    started = None
+    output = []
+
+    for line in stdout.splitlines():
+
+        if not line.startswith(MARKER):
+            output.append(line)
+            continue
+
+        fields = line.split()
+
+        if fields[1] == "begin":
+            started = float(fields[3])
+            output = []
+
+        elif fields[1] == "end":
+
+            # Drop the newline printed in front of the end marker
+            if len(output) != 0 and output[-1] == "":
+                output.pop()
+
+            idx = int(fields[2])
+            steps.append(StepResult(command=commands[idx],
+                                    exited=int(fields[3]),
+                                    stdout="\n".join(output),
+                                    started=started,
+                                    finished=float(fields[4])))
+
+    return steps
+
+
+def print_steps(host: str, steps: List[StepResult]) -> None:
+
+    for step in steps:
+        print(f"[{host}] $ {step.command} (exit={step.exited}, {step.duration:.2f}s)")
+        if step.stdout != "":
+            print(step.stdout)
+
@@ -0,0 +1,235 @@
+import time
+import fabric
+import tempfile
+import threading
+import subprocess
+from . import base
+from . import ssh
+from . import output
+from pathlib import Path
+from clusterize import structures
+from clusterize.utils import config, tracing
+from typing import Dict, IO, List, Set
+
+# Seconds the master connections stay open after the last command, so that the
+# following CLI invocations reuse them
+DEFAULT_CONTROL_PERSIST = 600
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+def control_dir() -> Path:
+
+    # The sockets give access to the nodes, only the user can reach them
+    directory = config.user_cache_dir() / "ssh"
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    return directory
+
+
+def ssh_args(node_info: ssh.NodeConnectionInfo,
+             control_persist: int = DEFAULT_CONTROL_PERSIST) -> List[str]:
+
+    args = ["ssh",
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=accept-new",
+            # %C is a hash of host, port and user, short enough for the socket path
+            "-o", f"ControlPath={control_dir() / '%C'}",
+            "-o", f"ControlPersist={control_persist}",
+            "-l", node_info.username]
+
+    if node_info.ssh_private_key != str(None):
+        args += ["-i", node_info.ssh_private_key]
+
+    return args
+
+
+class MasterConnections:
+
+    def __init__(self, control_persist: int = DEFAULT_CONTROL_PERSIST):
+
+        self.control_persist = control_persist
+
+        self._lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}
+        self._ready: Set[str] = set()
+
+    def ensure(self, node_info: ssh.NodeConnectionInfo) -> None:
+
+        with self._lock:
+            host_lock = self._host_locks.setdefault(node_info.ip, threading.Lock())
+
+        # Concurrent users of the same node wait for a single handshake
+        with host_lock:
+
+            if node_info.ip in self._ready:
+                return
+
+            args = ssh_args(node_info=node_info, control_persist=self.control_persist)
+
+            # A master left by a previous invocation is reused
+            check = subprocess.run(args + ["-O", "check", node_info.ip],
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+
+            if check.returncode != 0:
+
+                # The master goes in background keeping its stderr, a pipe would
+                # never be closed
+                with tracing.tracer.span(name="connect", category="ssh",
+                                         host=node_info.ip), \
+                        tempfile.TemporaryFile() as stderr:
+
+                    started = subprocess.run(
+                        args + ["-o", "ControlMaster=yes", "-f", "-N", node_info.ip],
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=stderr)
+
+                    stderr.seek(0)
+
+                    if started.returncode != 0:
+                        raise RuntimeError(f"Failed to connect to '{node_info.ip}': "
+                                           f"{stderr.read().decode().strip()}")
+
+            self._ready.add(node_info.ip)
+
+    def close(self, node_info: ssh.NodeConnectionInfo) -> None:
+
+        args = ssh_args(node_info=node_info, control_persist=self.control_persist)
+
+        _ = subprocess.run(args + ["-O", "exit", node_info.ip],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+
+        with self._lock:
+            self._ready.discard(node_info.ip)
+
+
+# Masters are shared by all the runners of the same CLI invocation and persist
+# after its end
+masters = MasterConnections()
+
+
+def read_stream(stream: IO,
+                buffer: List[str],
+                host_output: output.HostOutput = None,
+                max_buffer: int = output.DEFAULT_MAX_BUFFER) -> None:
+
+    size = 0
+
+    for line in stream:
+
+        buffer.append(line)
+        size += len(line)
+
+        # Keep only the tail of the output in memory
+        while size > max_buffer and len(buffer) > 1:
+            size -= len(buffer.pop(0))
+
+        if host_output is not None:
+            host_output.write(line)
+
+    stream.close()
+
+
+def run_node(node_info: ssh.NodeConnectionInfo,
+             cmd: str,
+             timeout: float = base.DEFAULT_TIMEOUT,
+             print_output: bool = False,
+             multiplexer: output.OutputMultiplexer = None,
+             phase: str = None) -> base.HostOutcome:
+
+    outcome = base.HostOutcome(host=node_info.ip)
+    connection = fabric.Connection(host=node_info.ip, user=node_info.username)
+
+    started = time.monotonic()
+
+    try:
+        masters.ensure(node_info=node_info)
+    except Exception as e:
+        outcome.exception = e
+        outcome.result = fabric.Result(connection=connection, command=cmd, exited=-1)
+        outcome.elapsed = time.monotonic() - started
+        return outcome
+
+    # The command only opens a new channel in the master connection
+    args = ssh_args(node_info=node_info, control_persist=masters.control_persist)
+    args += ["-o", "ControlMaster=no", node_info.ip, cmd]
+
+    streams = [None, None]
+
+    if print_output and multiplexer is not None:
+        streams = [multiplexer.stdout(host=node_info.ip),
+                   multiplexer.stderr(host=node_info.ip)]
+
+    stdout, stderr = [], []
+
+    with tracing.tracer.span(name="command", category="ssh", host=node_info.ip,
+                             phase=phase, cmd=cmd):
+
+        process = subprocess.Popen(args,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True,
+                                   errors="replace")
+
+        readers = [threading.Thread(target=read_stream, args=(stream, buffer, host_output))
+                   for stream, buffer, host_output
+                   in zip((process.stdout, process.stderr), (stdout, stderr), streams)]
+
+        for reader in readers:
+            reader.start()
+
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            outcome.timed_out = True
+            process.kill()
+            process.wait()
+
+        for reader in readers:
+            reader.join()
+
+    for stream in streams:
+        if stream is not None:
+            stream.close()
+
+    outcome.elapsed = time.monotonic() - started
+    outcome.result = fabric.Result(connection=connection,
+                                   command=cmd,
+                                   stdout="".join(stdout),
+                                   stderr="".join(stderr),
+                                   exited=-1 if outcome.timed_out else process.returncode,
+                                   hide=() if print_output else ("stdout", "stderr"))
+
+    return outcome
+
+
+class OpenSSHClusterCommandRunner(base.NodesCommandRunner):
+
+    def __init__(self,
+                 cluster: structures.cluster.Cluster,
+                 parallel: bool = False,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 multiplexer: output.OutputMultiplexer = None):
+
+        super().__init__(cluster=cluster,
+                         max_concurrency=max_concurrency if parallel else 1,
+                         multiplexer=multiplexer)
+
+    def _run_node(self,
+                  node_info: ssh.NodeConnectionInfo,
+                  cmd: str,
+                  timeout: float = base.DEFAULT_TIMEOUT,
+                  print_output: bool = False,
+                  multiplexer: output.OutputMultiplexer = None,
+                  phase: str = None) -> base.HostOutcome:
+
+        return run_node(node_info=node_info,
+                        cmd=cmd,
+                        timeout=timeout,
+                        print_output=print_output,
+                        multiplexer=multiplexer,
+                        phase=phase)
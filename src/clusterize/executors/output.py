@@ -0,0 +1,154 @@
+import sys
+import threading
+from pathlib import Path
+from fabric import runners
+from typing import IO, Dict, List
+
+# Maximum number of characters of stdout / stderr kept in memory for each host
+DEFAULT_MAX_BUFFER = 1024 * 1024
+
+
+class HostOutput:
+
+    def __init__(self,
+                 host: str,
+                 stream: IO,
+                 lock: threading.Lock,
+                 spill: IO = None,
+                 max_buffer: int = DEFAULT_MAX_BUFFER):
+
+        self.host = host
+        self.max_buffer = max_buffer
+
+        self._lock = lock
+        self._spill = spill
+        self._stream = stream
+        self._partial = ""
+
+    def write(self, data: str) -> None:
+
+        if self._spill is not None:
+            self._spill.write(data)
+
+        # Only complete lines are printed, so that the lines of different hosts
+        # never get mixed
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+
+        if len(lines) == 0:
+            return
+
+        with self._lock:
+            self._stream.write("".join(f"[{self.host}] {line}\n" for line in lines))
+
+    def flush(self) -> None:
+
+        if self._spill is not None:
+            self._spill.flush()
+
+        with self._lock:
+            self._stream.flush()
+
+    def close(self) -> None:
+
+        if self._partial != "":
+            self.write("\n")
+
+        self.flush()
+
+
+class OutputMultiplexer:
+
+    def __init__(self,
+                 spill_dir: str = None,
+                 max_buffer: int = DEFAULT_MAX_BUFFER,
+                 stdout: IO = None,
+                 stderr: IO = None):
+
+        self._lock = threading.Lock()
+        self._max_buffer = max_buffer
+        self._stdout = stdout
+        self._stderr = stderr
+        self._spill_dir = None if spill_dir is None else Path(spill_dir).expanduser()
+        self._spills: Dict[str, IO] = {}
+        self._outputs: List[HostOutput] = []
+
+    def _spill(self, host: str) -> IO:
+
+        if self._spill_dir is None:
+            return None
+
+        with self._lock:
+
+            if host not in self._spills:
+                self._spill_dir.mkdir(parents=True, exist_ok=True)
+                self._spills[host] = open(file=self._spill_dir / f"{host}.log", mode='a')
+
+            return self._spills[host]
+
+    def _output(self, host: str, stream: IO) -> HostOutput:
+
+        output = HostOutput(host=host,
+                            stream=stream,
+                            lock=self._lock,
+                            spill=self._spill(host=host),
+                            max_buffer=self._max_buffer)
+
+        self._outputs.append(output)
+        return output
+
+    def stdout(self, host: str) -> HostOutput:
+
+        # Resolved at runtime since sys.stdout could be redirected
+        return self._output(host=host,
+                            stream=self._stdout if self._stdout else sys.stdout)
+
+    def stderr(self, host: str) -> HostOutput:
+
+        return self._output(host=host,
+                            stream=self._stderr if self._stderr else sys.stderr)
+
+    def close(self) -> None:
+
+        for output in self._outputs:
+            output.close()
+
+        for spill in self._spills.values():
+            spill.close()
+
+        self._outputs.clear()
+        self._spills.clear()
+
+    def __enter__(self) -> "OutputMultiplexer":
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+
+class StreamingRemote(runners.Remote):
+
+    def _handle_output(self, buffer_: List[str], hide: bool, output: IO, reader) -> None:
+
+        if not isinstance(output, HostOutput):
+            return super()._handle_output(buffer_, hide, output, reader)
+
+        size = 0
+
+        for data in self.read_proc_output(reader):
+
+            if not hide:
+                self.write_our_output(stream=output, string=data)
+
+            buffer_.append(data)
+            size += len(data)
+
+            # Keep only the tail of the output in memory
+            while size > output.max_buffer and len(buffer_) > 1:
+                size -= len(buffer_.pop(0))
+
+            # Joining the buffer is expensive, do it only if someone is watching
+            if len(self.watchers) != 0:
+                self.respond(buffer_)
@@ -0,0 +1,90 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+@dataclass
+class Task:
+
+    name: str
+    function: Callable[[], Any]
+    depends_on: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TaskOutcome:
+
+    name: str
+    result: Any = None
+    exception: Optional[BaseException] = None
+    skipped: bool = False
+
+    @property
+    def failed(self) -> bool:
+
+        return self.exception is not None or self.skipped
+
+
+def run_dag(tasks: List[Task], max_workers: int = None) -> Dict[str, TaskOutcome]:
+
+    tasks_by_name = {task.name: task for task in tasks}
+
+    if len(tasks_by_name) != len(tasks):
+        raise ValueError("Task names must be unique")
+
+    for task in tasks:
+        for dependency in task.depends_on:
+            if dependency not in tasks_by_name:
+                raise ValueError(f"Task '{task.name}' depends on unknown '{dependency}'")
+
+    if max_workers is None:
+        max_workers = max(len(tasks), 1)
+
+    outcomes: Dict[str, TaskOutcome] = {}
+    pending = {task.name: set(task.depends_on) for task in tasks}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        running = {}
+
+        while len(pending) != 0 or len(running) != 0:
+
+            changed = True
+
+            # Skipping a task can unblock (and skip) its dependents
+            while changed:
+
+                changed = False
+
+                for name in list(pending.keys()):
+
+                    dependencies = pending[name]
+
+                    # Tasks that depend on a failed task are never executed
+                    if any(outcomes[d].failed for d in dependencies if d in outcomes):
+                        outcomes[name] = TaskOutcome(name=name, skipped=True)
+                        del pending[name]
+                        changed = True
+
+                    elif all(d in outcomes for d in dependencies):
+                        future = executor.submit(tasks_by_name[name].function)
+                        running[future] = name
+                        del pending[name]
+
+            if len(running) == 0:
+                if len(pending) != 0:
+                    raise RuntimeError("Task graph contains a cycle")
+                break
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+            for future in done:
+
+                name = running.pop(future)
+
+                try:
+                    outcomes[name] = TaskOutcome(name=name, result=future.result())
+                except Exception as e:
+                    outcomes[name] = TaskOutcome(name=name, exception=e)
+
+    return outcomes
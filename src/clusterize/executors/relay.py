@@ -0,0 +1,261 @@
+import time
+import shlex
+import invoke
+import fabric
+import threading
+from . import base
+from . import ssh
+from . import output
+from clusterize import structures
+from clusterize.utils import tracing
+from typing import Dict, List
+
+# Key deployed in the head by cluster start, used to reach the workers
+RELAY_SSH_KEY = "cluster_ssh_key.pem"
+
+# Maximum number of workers reached by the head at the same time
+DEFAULT_MAX_FANOUT = 64
+
+# The relay completes after the slowest node, leave it some time on top of the
+# timeout of the nodes before considering the head unresponsive
+RELAY_TIMEOUT_MARGIN = 10.0
+
+# Environment variable storing the relayed command in the head
+RELAY_CMD_ENV_VAR = "CLUSTERIZE_RELAY_CMD"
+
+# Exit code of the coreutils timeout command
+TIMEOUT_EXIT_CODE = 124
+
+
+def relay_cmd(cmd: str,
+              hosts: List[str],
+              head_ip: str,
+              username: str,
+              ssh_key: str = RELAY_SSH_KEY,
+              timeout: float = None,
+              max_fanout: int = DEFAULT_MAX_FANOUT) -> str:
+
+    ssh_cmd = f"ssh -n -i {shlex.quote(ssh_key)} " \
+              f"-o StrictHostKeyChecking=no -o BatchMode=yes"
+
+    limit = "" if timeout is None else f"timeout {timeout:g} "
+
+    # The node address is passed by xargs as $0 of the inner shell. Every line of
+    # the node is tagged with its address and stream, and its exit code is printed
+    # last, so that the client can split the single output of the head.
+    script = "\n".join([
+        "tag() { awk -v p=\"$1\" '{ print p $0; fflush() }'; }",
+        "status=$(mktemp)",
+        "case \"$0\" in",
+        f"  {shlex.quote(head_ip)}) run() {{ {limit}${{SHELL:-sh}} "
+        f"-c \"${RELAY_CMD_ENV_VAR}\" < /dev/null; }} ;;",
+        f"  *) run() {{ {limit}{ssh_cmd} {shlex.quote(username)}@\"$0\" "
+        f"\"${RELAY_CMD_ENV_VAR}\"; }} ;;",
+        "esac",
+        "{ { { run 3>&- 4>&-; echo $? > \"$status\"; } 2>&1 1>&3 | "
+        "tag \"$0\\te\\t\" >&4; } 3>&1 | tag \"$0\\to\\t\"; } 4>&1",
+        "printf '%s\\tx\\t%s\\n' \"$0\" \"$(cat \"$status\")\"",
+        "rm -f \"$status\"",
+    ])
+
+    ips = " ".join(shlex.quote(ip) for ip in hosts)
+
+    return f"export {RELAY_CMD_ENV_VAR}={shlex.quote(cmd)}; " \
+           f"printf '%s\\n' {ips} | " \
+           f"xargs -P {max_fanout} -n 1 sh -c {shlex.quote(script)}"
+
+
+class RelayOutput:
+
+    def __init__(self,
+                 hosts: List[str],
+                 multiplexer: output.OutputMultiplexer = None,
+                 max_buffer: int = output.DEFAULT_MAX_BUFFER):
+
+        self.exit_codes: Dict[str, int] = {}
+        self.elapsed: Dict[str, float] = {}
+
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._partial = ""
+        self._max_buffer = max_buffer
+        self._buffers = {host: {"o": [], "e": []} for host in hosts}
+        self._sizes = {host: {"o": 0, "e": 0} for host in hosts}
+        self._streams: Dict[str, Dict[str, output.HostOutput]] = {}
+
+        if multiplexer is not None:
+            self._streams = {host: {"o": multiplexer.stdout(host=host),
+                                    "e": multiplexer.stderr(host=host)}
+                             for host in hosts}
+
+    def write(self, data: str) -> None:
+
+        with self._lock:
+
+            lines = (self._partial + data).split("\n")
+            self._partial = lines.pop()
+
+            for line in lines:
+                self._dispatch(line=line)
+
+    def flush(self) -> None:
+
+        pass
+
+    def close(self) -> None:
+
+        for streams in self._streams.values():
+            for stream in streams.values():
+                stream.close()
+
+    def stdout(self, host: str) -> str:
+
+        return "".join(self._buffers[host]["o"])
+
+    def stderr(self, host: str) -> str:
+
+        return "".join(self._buffers[host]["e"])
+
+    def _dispatch(self, line: str) -> None:
+
+        host, _, rest = line.partition("\t")
+        kind, _, data = rest.partition("\t")
+
+        # Lines not produced by the relay, e.g. the login banner of the head
+        if host not in self._buffers or kind not in ("o", "e", "x"):
+            return
+
+        if kind == "x":
+            self.exit_codes[host] = int(data) if data.strip().isdigit() else -1
+            self.elapsed[host] = time.monotonic() - self._started
+            return
+
+        buffer = self._buffers[host][kind]
+        buffer.append(data + "\n")
+        self._sizes[host][kind] += len(data) + 1
+
+        # Keep only the tail of the output in memory
+        while self._sizes[host][kind] > self._max_buffer and len(buffer) > 1:
+            self._sizes[host][kind] -= len(buffer.pop(0))
+
+        if host in self._streams:
+            self._streams[host][kind].write(data + "\n")
+
+
+class RelayClusterCommandRunner(base.NodesCommandRunner):
+
+    def __init__(self,
+                 cluster: structures.cluster.Cluster,
+                 parallel: bool = False,
+                 max_fanout: int = DEFAULT_MAX_FANOUT,
+                 multiplexer: output.OutputMultiplexer = None):
+
+        super().__init__(cluster=cluster, multiplexer=multiplexer)
+
+        self._max_fanout = max_fanout if parallel else 1
+
+        # The head is reached directly, all the other nodes through it
+        self._head_runner = ssh.SSHClusterCommandRunner(cluster=cluster,
+                                                        parallel=parallel,
+                                                        multiplexer=multiplexer)
+
+    def run_in_head(self,
+                    cmd: str,
+                    timeout: float = base.DEFAULT_TIMEOUT,
+                    print_output: bool = False,
+                    allow_failures: bool = False) -> fabric.Result:
+
+        return self._head_runner.run_in_head(cmd=cmd,
+                                             timeout=timeout,
+                                             print_output=print_output,
+                                             allow_failures=allow_failures)
+
+    def _run_nodes(self,
+                   nodes_info: List[ssh.NodeConnectionInfo],
+                   cmd: str,
+                   timeout: float = base.DEFAULT_TIMEOUT,
+                   print_output: bool = False) -> List[base.HostOutcome]:
+
+        if len(nodes_info) == 0:
+            return []
+
+        outcomes = self._run_relayed(hosts=[node_info.ip for node_info in nodes_info],
+                                     cmd=cmd,
+                                     timeout=timeout,
+                                     print_output=print_output)
+
+        return list(outcomes.values())
+
+    def _run_relayed(self,
+                     hosts: List[str],
+                     cmd: str,
+                     timeout: float = base.DEFAULT_TIMEOUT,
+                     print_output: bool = False) -> Dict[str, base.HostOutcome]:
+
+        head_info = ssh.SSHClusterCommandRunner.head_connection_info(cluster=self._cluster)
+        connection = ssh.connection_pool.connection(node_info=head_info)
+
+        multiplexer = None
+
+        if print_output:
+            multiplexer = self._multiplexer if self._multiplexer is not None \
+                else output.OutputMultiplexer()
+
+        relay_output = RelayOutput(hosts=hosts, multiplexer=multiplexer)
+
+        relayed = relay_cmd(cmd=cmd,
+                            hosts=hosts,
+                            head_ip=head_info.ip,
+                            username=head_info.username,
+                            timeout=timeout,
+                            max_fanout=self._max_fanout)
+
+        exception = None
+        relay_timed_out = False
+
+        try:
+            with tracing.tracer.span(name="relay", category="ssh", host=head_info.ip,
+                                     cmd=cmd, nodes=len(hosts)):
+                connection.run(command=relayed,
+                               hide=False,
+                               warn=True,
+                               timeout=None if timeout is None
+                               else timeout + RELAY_TIMEOUT_MARGIN,
+                               out_stream=relay_output,
+                               err_stream=relay_output)
+        except invoke.exceptions.CommandTimedOut:
+            relay_timed_out = True
+        except Exception as e:
+            exception = e
+        finally:
+            relay_output.close()
+
+        outcomes = {}
+
+        for host in hosts:
+
+            outcome = base.HostOutcome(host=host)
+            node = fabric.Connection(host=host, user=head_info.username)
+
+            exited = relay_output.exit_codes.get(host, None)
+
+            # Nodes not reported by the relay never completed the command
+            if exited is None:
+                outcome.exception = exception
+                outcome.timed_out = exception is None and relay_timed_out
+                outcome.result = fabric.Result(connection=node, command=cmd, exited=-1)
+                outcomes[host] = outcome
+                continue
+
+            outcome.timed_out = timeout is not None and exited == TIMEOUT_EXIT_CODE
+            outcome.elapsed = relay_output.elapsed[host]
+            outcome.result = fabric.Result(connection=node,
+                                           command=cmd,
+                                           stdout=relay_output.stdout(host=host),
+                                           stderr=relay_output.stderr(host=host),
+                                           exited=exited,
+                                           hide=() if print_output
+                                           else ("stdout", "stderr"))
+            outcomes[host] = outcome
+
+        return outcomes
@@ -1,13 +1,19 @@
 import copy
+import time
+import atexit
 import invoke
 import fabric
+import threading
 from . import base
+from . import output
 from pathlib import Path
 from functools import partial
 from clusterize import structures
+from clusterize.utils import tracing
 from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Callable, ContextManager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, ContextManager, Dict, List, Tuple
 
 
 RunCallableGroup = Callable[[str, float, bool, bool], fabric.GroupResult]
@@ -30,6 +36,59 @@ class GroupConnectionInfo:
     ssh_private_key: str
 
 
+class ConnectionPool:
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._connections: Dict[Tuple[str, str, str], fabric.Connection] = {}
+
+    def connection(self, node_info: NodeConnectionInfo) -> fabric.Connection:
+
+        key = (node_info.ip, node_info.username, node_info.ssh_private_key)
+
+        with self._lock:
+
+            if key not in self._connections:
+                self._connections[key] = \
+                    SSHCommandRunner.connection_from_node_info(node_info=node_info)
+
+            return self._connections[key]
+
+    def group(self,
+              group_info: GroupConnectionInfo,
+              parallel: bool = False) -> fabric.Group:
+
+        if not parallel:
+            fabric_group_cls = fabric.SerialGroup
+        else:
+            fabric_group_cls = fabric.ThreadingGroup
+
+        connections = [
+            self.connection(node_info=NodeConnectionInfo(
+                ip=ip,
+                username=group_info.username,
+                ssh_private_key=group_info.ssh_private_key))
+            for ip in group_info.ips]
+
+        return fabric_group_cls.from_connections(connections)
+
+    def close(self) -> None:
+
+        with self._lock:
+
+            for connection in self._connections.values():
+                connection.close()
+
+            self._connections.clear()
+
+
+# Connections are shared by all the runners of the same CLI invocation, so that
+# every node performs the SSH handshake only once
+connection_pool = ConnectionPool()
+atexit.register(connection_pool.close)
+
+
 class SSHCommandRunner(base.CommandRunner):
 
     def __init__(self, node_info: NodeConnectionInfo):
@@ -54,21 +113,74 @@ class SSHCommandRunner(base.CommandRunner):
     @staticmethod
     def run_connection(connection: fabric.Connection,
                        cmd: str,
-                       timeout: float = base.DEFAULT_TIMEOUT,  # TODO
+                       timeout: float = base.DEFAULT_TIMEOUT,
                        print_output: bool = False,
-                       allow_failures: bool = True) -> fabric.Result:
-
-        if allow_failures is False:
-            result = connection.run(command=cmd, hide=not print_output)
-
-        else:
-            try:
-                result = connection.run(command=cmd, hide=not print_output)
-            except invoke.exceptions.UnexpectedExit as e:
-                result = e.result
+                       allow_failures: bool = True,
+                       multiplexer: output.OutputMultiplexer = None,
+                       phase: str = None) -> fabric.Result:
+
+        streams = {}
+        tracer = tracing.tracer
+
+        # Open the connection explicitly to trace the handshake on its own
+        if tracer.enabled and not connection.is_connected:
+            with tracer.span(name="connect", category="ssh", host=connection.host,
+                             phase=phase):
+                connection.open()
+
+        # Stream the output line by line tagged with the host
+        if print_output and multiplexer is not None:
+            streams = dict(out_stream=multiplexer.stdout(host=connection.host),
+                           err_stream=multiplexer.stderr(host=connection.host))
+
+        try:
+            with tracer.span(name="command", category="ssh", host=connection.host,
+                             phase=phase, cmd=cmd):
+                result = connection.run(command=cmd,
+                                        hide=not print_output,
+                                        timeout=timeout,
+                                        **streams)
+
+        except invoke.exceptions.UnexpectedExit as e:
+            if allow_failures is False:
+                raise
+            result = e.result
+
+        finally:
+            for stream in streams.values():
+                stream.close()
 
         return result
 
+    @staticmethod
+    def run_connection_outcome(connection: fabric.Connection,
+                               cmd: str,
+                               timeout: float = base.DEFAULT_TIMEOUT,
+                               print_output: bool = False,
+                               multiplexer: output.OutputMultiplexer = None,
+                               phase: str = None) \
+            -> base.HostOutcome:
+
+        outcome = base.HostOutcome(host=connection.host)
+        started = time.monotonic()
+
+        try:
+            outcome.result = SSHCommandRunner.run_connection(connection=connection,
+                                                             cmd=cmd,
+                                                             timeout=timeout,
+                                                             print_output=print_output,
+                                                             allow_failures=True,
+                                                             multiplexer=multiplexer,
+                                                             phase=phase)
+        except invoke.exceptions.CommandTimedOut as e:
+            outcome.result = e.result
+            outcome.timed_out = True
+        except Exception as e:
+            outcome.exception = e
+
+        outcome.elapsed = time.monotonic() - started
+        return outcome
+
     @staticmethod
     def connection_from_node_info(node_info: NodeConnectionInfo) -> fabric.Connection:
 
@@ -82,6 +194,9 @@ class SSHCommandRunner(base.CommandRunner):
             user=node_info.username,
             connect_kwargs={'key_filename': str(ssh_private_key)})
 
+        # Use the runner that keeps bounded buffers when streaming the output
+        connection.config.runners.remote = output.StreamingRemote
+
         return connection
 
     @property
@@ -90,7 +205,7 @@ class SSHCommandRunner(base.CommandRunner):
         if self._connection is not None:
             return self._connection
 
-        connection = SSHCommandRunner.connection_from_node_info(node_info=self._node_info)
+        connection = connection_pool.connection(node_info=self._node_info)
 
         self._connection = connection
         return self._connection
@@ -132,40 +247,70 @@ class SSHGroupCommandRunner(base.CommandGroupRunner):
     @staticmethod
     def run_group(group: fabric.Group,
                   cmd: str,
-                  timeout: float = base.DEFAULT_TIMEOUT,  # TODO
+                  timeout: float = base.DEFAULT_TIMEOUT,
                   print_output: bool = False,
-                  allow_failures: bool = False):
+                  allow_failures: bool = False,
+                  multiplexer: output.OutputMultiplexer = None):
 
-        if allow_failures is False:
-            result = group.run(command=cmd, hide=not print_output)
+        try:
+            if not print_output:
+                result = group.run(command=cmd, hide=True, timeout=timeout)
 
-        else:
-            try:
-                result = group.run(command=cmd, hide=not print_output)
-            except invoke.exceptions.UnexpectedExit as e:
-                result = e.result
+            elif multiplexer is not None:
+                result = SSHGroupCommandRunner.run_group_streaming(
+                    group=group, cmd=cmd, timeout=timeout, multiplexer=multiplexer)
+
+            else:
+                with output.OutputMultiplexer() as multiplexer:
+                    result = SSHGroupCommandRunner.run_group_streaming(
+                        group=group, cmd=cmd, timeout=timeout, multiplexer=multiplexer)
+
+        except fabric.exceptions.GroupException as e:
+
+            if allow_failures is False:
+                raise
+
+            result = e.result
+
+            # Return the results of the failed commands like run_connection does
+            for connection, value in result.items():
+                if isinstance(value, invoke.exceptions.UnexpectedExit):
+                    result[connection] = value.result
 
         return result
 
     @staticmethod
-    def group_from_group_info(group_info: GroupConnectionInfo,
-                              parallel: bool = False) -> fabric.Group:
-        ssh_private_key = Path(group_info.ssh_private_key).expanduser().absolute()
+    def run_group_streaming(group: fabric.Group,
+                            cmd: str,
+                            multiplexer: output.OutputMultiplexer,
+                            timeout: float = base.DEFAULT_TIMEOUT) -> fabric.GroupResult:
 
-        if not ssh_private_key.exists():
-            ssh_private_key = None
+        phase = tracing.tracer.phase
 
-        if not parallel:
-            fabric_group_cls = fabric.SerialGroup
-        else:
-            fabric_group_cls = fabric.ThreadingGroup
+        # Like fabric groups, but every host streams in its own line-prefixed output
+        def run(connection: fabric.Connection):
 
-        group = fabric_group_cls(
-            *group_info.ips,
-            user=group_info.username,
-            connect_kwargs={'key_filename': str(ssh_private_key)})
+            try:
+                return SSHCommandRunner.run_connection(connection=connection,
+                                                       cmd=cmd,
+                                                       timeout=timeout,
+                                                       print_output=True,
+                                                       allow_failures=False,
+                                                       multiplexer=multiplexer,
+                                                       phase=phase)
+            except Exception as e:
+                return e
+
+        parallel = isinstance(group, fabric.ThreadingGroup)
+        max_workers = max(len(group), 1) if parallel else 1
 
-        return group
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            result = fabric.GroupResult(zip(group, executor.map(run, group)))
+
+        if any(isinstance(value, BaseException) for value in result.values()):
+            raise fabric.exceptions.GroupException(result)
+
+        return result
 
     @property
     def group(self) -> fabric.Group:
@@ -173,8 +318,8 @@ class SSHGroupCommandRunner(base.CommandGroupRunner):
         if self._group is not None:
             return self._group
 
-        group = SSHGroupCommandRunner.group_from_group_info(group_info=self._group_info,
-                                                            parallel=self._parallel)
+        group = connection_pool.group(group_info=self._group_info,
+                                      parallel=self._parallel)
 
         self._group = group
         return self._group
@@ -195,12 +340,14 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
 
     def __init__(self,
                  cluster: structures.cluster.Cluster,
-                 parallel: bool = False):
+                 parallel: bool = False,
+                 multiplexer: output.OutputMultiplexer = None):
 
         super().__init__()
 
         self._cluster = cluster
         self._parallel = parallel
+        self._multiplexer = multiplexer
 
     def run_in_head(self,
                     cmd: str,
@@ -209,14 +356,15 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
                     allow_failures: bool = False) -> fabric.Result:
 
         head_info = SSHClusterCommandRunner.head_connection_info(cluster=self._cluster)
-        connection = SSHCommandRunner.connection_from_node_info(node_info=head_info)
+        connection = connection_pool.connection(node_info=head_info)
 
         return SSHCommandRunner.run_connection(
             connection=connection,
             cmd=cmd,
             timeout=timeout,
             print_output=print_output,
-            allow_failures=allow_failures)
+            allow_failures=allow_failures,
+            multiplexer=self._multiplexer)
 
     def run_in_workers(self,
                        cmd: str,
@@ -226,15 +374,15 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
 
         workers_info = SSHClusterCommandRunner.workers_connection_info(
             cluster=self._cluster)
-        group = SSHGroupCommandRunner.group_from_group_info(
-            group_info=workers_info, parallel=self._parallel)
+        group = connection_pool.group(group_info=workers_info, parallel=self._parallel)
 
         return SSHGroupCommandRunner.run_group(
             group=group,
             cmd=cmd,
             timeout=timeout,
             print_output=print_output,
-            allow_failures=allow_failures)
+            allow_failures=allow_failures,
+            multiplexer=self._multiplexer)
 
     def run_in_cluster(self,
                        cmd: str,
@@ -244,23 +392,65 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
 
         cluster_info = SSHClusterCommandRunner.cluster_connection_info(
             cluster=self._cluster)
-        group = SSHGroupCommandRunner.group_from_group_info(
-            group_info=cluster_info, parallel=self._parallel)
+        group = connection_pool.group(group_info=cluster_info, parallel=self._parallel)
 
         return SSHGroupCommandRunner.run_group(
             group=group,
             cmd=cmd,
             timeout=timeout,
             print_output=print_output,
-            allow_failures=allow_failures)
+            allow_failures=allow_failures,
+            multiplexer=self._multiplexer)
+
+    def run_outcomes(self,
+                     cmd: str,
+                     on: str = "CLUSTER",
+                     timeout: float = base.DEFAULT_TIMEOUT,
+                     print_output: bool = False,
+                     policy: base.RetryPolicy = None,
+                     hosts: List[str] = None) \
+            -> Dict[str, base.HostOutcome]:
+
+        multiplexer = self._multiplexer
+
+        if multiplexer is None:
+            multiplexer = output.OutputMultiplexer()
+
+        # The worker threads do not know the phase of the calling thread
+        phase = tracing.tracer.phase
+
+        def run_nodes(nodes_info: List[NodeConnectionInfo], attempt_timeout: float) \
+                -> List[base.HostOutcome]:
+
+            max_workers = max(len(nodes_info), 1) if self._parallel else 1
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(
+                    lambda node_info: SSHCommandRunner.run_connection_outcome(
+                        connection=connection_pool.connection(node_info=node_info),
+                        cmd=cmd,
+                        timeout=attempt_timeout,
+                        print_output=print_output,
+                        multiplexer=multiplexer,
+                        phase=phase),
+                    nodes_info))
+
+        return base.run_nodes_with_retries(
+            run_nodes=run_nodes,
+            nodes_info=SSHClusterCommandRunner.nodes_connection_info(
+                cluster=self._cluster, on=on, hosts=hosts),
+            timeout=timeout,
+            policy=policy)
 
     @contextmanager
     def in_head(self) -> ContextManager[RunCallableConnection]:
 
         head_info = SSHClusterCommandRunner.head_connection_info(cluster=self._cluster)
-        connection = SSHCommandRunner.connection_from_node_info(node_info=head_info)
+        connection = connection_pool.connection(node_info=head_info)
 
-        in_head = partial(SSHCommandRunner.run_connection, connection=connection)
+        in_head = partial(SSHCommandRunner.run_connection,
+                          connection=connection,
+                          multiplexer=self._multiplexer)
 
         yield in_head
 
@@ -270,10 +460,11 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
         workers_info = SSHClusterCommandRunner.workers_connection_info(
             cluster=self._cluster)
 
-        group = SSHGroupCommandRunner.group_from_group_info(
-            group_info=workers_info, parallel=self._parallel)
+        group = connection_pool.group(group_info=workers_info, parallel=self._parallel)
 
-        in_workers = partial(SSHGroupCommandRunner.run_group, group=group)
+        in_workers = partial(SSHGroupCommandRunner.run_group,
+                             group=group,
+                             multiplexer=self._multiplexer)
 
         yield in_workers
 
@@ -283,10 +474,11 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
         cluster_info = SSHClusterCommandRunner.cluster_connection_info(
             cluster=self._cluster)
 
-        group = SSHGroupCommandRunner.group_from_group_info(
-            group_info=cluster_info, parallel=self._parallel)
+        group = connection_pool.group(group_info=cluster_info, parallel=self._parallel)
 
-        in_cluster = partial(SSHGroupCommandRunner.run_group, group=group)
+        in_cluster = partial(SSHGroupCommandRunner.run_group,
+                             group=group,
+                             multiplexer=self._multiplexer)
 
         yield in_cluster
 
@@ -336,3 +528,41 @@ class SSHClusterCommandRunner(base.CommandClusterRunner,
         cluster_info.ips.append(head_info.ip)
 
         return cluster_info
+
+    @staticmethod
+    def group_connection_info(cluster: structures.cluster.Cluster,
+                              on: str = "CLUSTER") -> GroupConnectionInfo:
+
+        if on == "HEAD":
+            head_info = SSHClusterCommandRunner.head_connection_info(cluster=cluster)
+            return GroupConnectionInfo(ips=[head_info.ip],
+                                       username=head_info.username,
+                                       ssh_private_key=head_info.ssh_private_key)
+
+        elif on == "WORKERS":
+            return SSHClusterCommandRunner.workers_connection_info(cluster=cluster)
+
+        elif on == "CLUSTER":
+            return SSHClusterCommandRunner.cluster_connection_info(cluster=cluster)
+
+        else:
+            raise ValueError(f"'{on}' not recognized")
+
+    @staticmethod
+    def nodes_connection_info(cluster: structures.cluster.Cluster,
+                              on: str = "CLUSTER",
+                              hosts: List[str] = None) -> List[NodeConnectionInfo]:
+
+        group_info = SSHClusterCommandRunner.group_connection_info(cluster=cluster, on=on)
+
+        # Optionally operate only on a subset of the selected nodes
+        if hosts is None:
+            hosts = group_info.ips
+
+        elif not set(hosts).issubset(group_info.ips):
+            raise ValueError(f"Hosts {hosts} are not part of the '{on}' nodes")
+
+        return [NodeConnectionInfo(ip=ip,
+                                   username=group_info.username,
+                                   ssh_private_key=group_info.ssh_private_key)
+                for ip in hosts]
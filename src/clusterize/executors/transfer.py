@@ -0,0 +1,317 @@
+import shlex
+import fabric
+import socket
+import tarfile
+import threading
+from . import ssh
+from clusterize.utils import tracing
+from fabric import transfer
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_TRANSFERS = 16
+DEFAULT_IMAGE_FANOUT = 1
+
+# Size of the blocks streamed to the standard input of the remote commands
+STREAM_BLOCK_SIZE = 256 * 1024
+
+# Seconds without progress after which streaming to a command fails. Once all
+# the input is sent, the command can run for as long as it needs.
+DEFAULT_STREAM_TIMEOUT = 60.0
+
+
+@dataclass
+class FileTransfer:
+
+    local: str
+    remote: str
+
+
+def put_in_host(node_info: ssh.NodeConnectionInfo,
+                transfers: List[FileTransfer],
+                phase: str = None) -> List[transfer.Result]:
+
+    connection = ssh.connection_pool.connection(node_info=node_info)
+    results = []
+
+    for t in transfers:
+        with tracing.tracer.span(name="put", category="transfer", host=node_info.ip,
+                                 phase=phase, remote=t.remote):
+            results.append(connection.put(local=t.local, remote=t.remote))
+
+    return results
+
+
+def put_in_hosts(group_info: ssh.GroupConnectionInfo,
+                 transfers: List[FileTransfer],
+                 max_transfers: int = DEFAULT_MAX_TRANSFERS) \
+        -> Dict[str, List[transfer.Result]]:
+
+    nodes_info = [ssh.NodeConnectionInfo(ip=ip,
+                                         username=group_info.username,
+                                         ssh_private_key=group_info.ssh_private_key)
+                  for ip in group_info.ips]
+
+    if len(nodes_info) == 0:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_transfers) as executor:
+
+        futures = {
+            node_info.ip: executor.submit(put_in_host, node_info, transfers,
+                                          tracing.tracer.phase)
+            for node_info in nodes_info}
+
+        # Re-raise the first failed transfer, if any
+        return {ip: future.result() for ip, future in futures.items()}
+
+
+def forward_from_head_cmd(worker_ips: List[str],
+                          username: str,
+                          remote_files: List[str],
+                          ssh_key: str,
+                          max_transfers: int = DEFAULT_MAX_TRANSFERS) -> str:
+
+    scp = f"scp -q -i {shlex.quote(ssh_key)} " \
+          f"-o StrictHostKeyChecking=no -o BatchMode=yes"
+
+    # The worker address is passed by xargs as $0 of the inner shell
+    copies = " && ".join(
+        f"{scp} {shlex.quote(f)} {username}@$0:{shlex.quote(f)}" for f in remote_files)
+
+    ips = " ".join(shlex.quote(ip) for ip in worker_ips)
+
+    return f"printf '%s\\n' {ips} | " \
+           f"xargs -P {max_transfers} -n 1 sh -c {shlex.quote(copies)}"
+
+
+def put_in_cluster_tree(head_info: ssh.NodeConnectionInfo,
+                        workers_info: ssh.GroupConnectionInfo,
+                        transfers: List[FileTransfer],
+                        head_ssh_key: str,
+                        max_transfers: int = DEFAULT_MAX_TRANSFERS) \
+        -> Optional[fabric.Result]:
+
+    # Upload only once over the client uplink
+    _ = put_in_host(node_info=head_info, transfers=transfers)
+
+    if len(workers_info.ips) == 0:
+        return None
+
+    # The head forwards the files to the workers over the cluster network
+    cmd = forward_from_head_cmd(worker_ips=workers_info.ips,
+                                username=workers_info.username,
+                                remote_files=[t.remote for t in transfers],
+                                ssh_key=head_ssh_key,
+                                max_transfers=max_transfers)
+
+    connection = ssh.connection_pool.connection(node_info=head_info)
+
+    return ssh.SSHCommandRunner.run_connection(connection=connection,
+                                               cmd=cmd,
+                                               timeout=None,
+                                               allow_failures=False)
+
+
+def distribution_rounds(source: str,
+                        targets: List[str],
+                        fanout: int = DEFAULT_IMAGE_FANOUT) -> List[List[Tuple[str, str]]]:
+
+    rounds = []
+    pending = list(targets)
+    holders = [source]
+
+    # Every node that already received the data becomes a source in the next
+    # round, so the number of rounds grows logarithmically with the targets
+    while len(pending) != 0:
+
+        pairs = []
+
+        for src in holders:
+            for _ in range(fanout):
+                if len(pending) != 0:
+                    pairs.append((src, pending.pop(0)))
+
+        holders += [dst for _, dst in pairs]
+        rounds.append(pairs)
+
+    return rounds
+
+
+def distribute_image_cmd(image: str,
+                         source: str,
+                         worker_ips: List[str],
+                         username: str,
+                         ssh_key: str,
+                         fanout: int = DEFAULT_IMAGE_FANOUT) -> str:
+
+    ssh = f"ssh -i {shlex.quote(ssh_key)} -o StrictHostKeyChecking=no -o BatchMode=yes"
+
+    lines = []
+
+    for pairs in distribution_rounds(source=source, targets=worker_ips, fanout=fanout):
+
+        lines.append("pids=''")
+
+        for src, dst in pairs:
+
+            # Stream the image without storing any archive on disk
+            load = f"docker save {shlex.quote(image)} | " \
+                   f"{ssh} {username}@{dst} docker load"
+
+            if src != source:
+                load = f"{ssh} {username}@{src} {shlex.quote(load)}"
+
+            lines.append(f"( {load} ) & pids=\"$pids $!\"")
+
+        # A round starts only when all the copies of the previous one completed
+        lines.append("for pid in $pids; do wait $pid || exit 1; done")
+
+    return "\n".join(lines)
+
+
+def put_image_in_cluster_tree(head_info: ssh.NodeConnectionInfo,
+                              workers_info: ssh.GroupConnectionInfo,
+                              image: str,
+                              head_ssh_key: str,
+                              fanout: int = DEFAULT_IMAGE_FANOUT) \
+        -> Optional[fabric.Result]:
+
+    if len(workers_info.ips) == 0:
+        return None
+
+    # The image must already be present in the head
+    cmd = distribute_image_cmd(image=image,
+                               source=head_info.ip,
+                               worker_ips=workers_info.ips,
+                               username=workers_info.username,
+                               ssh_key=head_ssh_key,
+                               fanout=fanout)
+
+    connection = ssh.connection_pool.connection(node_info=head_info)
+
+    return ssh.SSHCommandRunner.run_connection(connection=connection,
+                                               cmd=cmd,
+                                               timeout=None,
+                                               allow_failures=False)
+
+
+class ChannelWriter:
+
+    def __init__(self, channel):
+
+        self._channel = channel
+
+    def write(self, data: bytes) -> int:
+
+        self._channel.sendall(data)
+        return len(data)
+
+
+def run_with_input(node_info: ssh.NodeConnectionInfo,
+                   cmd: str,
+                   write: Callable[[ChannelWriter], None],
+                   phase: str = None,
+                   timeout: float = DEFAULT_STREAM_TIMEOUT) -> str:
+
+    connection = ssh.connection_pool.connection(node_info=node_info)
+    connection.open()
+
+    # Stream the data to the standard input of the command through the
+    # connection already open with the node
+    with tracing.tracer.span(name="stream", category="transfer", host=node_info.ip,
+                             phase=phase, cmd=cmd):
+
+        channel = connection.client.get_transport().open_session()
+
+        # Sending fails after timeout seconds without progress
+        channel.settimeout(timeout)
+
+        stdout, stderr = [], []
+
+        def drain(recv: Callable[[int], bytes], buffer: List[bytes]) -> None:
+
+            while True:
+
+                try:
+                    data = recv(STREAM_BLOCK_SIZE)
+                except socket.timeout:
+                    # The command can be silent while it runs
+                    continue
+                except OSError:
+                    return
+
+                if len(data) == 0:
+                    return
+
+                buffer.append(data)
+
+        try:
+            channel.exec_command(cmd)
+
+            # The output is read while writing, a command blocked on its full
+            # output would stop reading its input
+            streams = ((channel.recv, stdout), (channel.recv_stderr, stderr))
+            readers = [threading.Thread(target=drain, args=(recv, buffer), daemon=True)
+                       for recv, buffer in streams]
+
+            for reader in readers:
+                reader.start()
+
+            write_error = None
+
+            try:
+                write(ChannelWriter(channel=channel))
+                channel.shutdown_write()
+            except socket.timeout:
+                raise RuntimeError(f"Command '{cmd}' in '{node_info.ip}' stopped reading "
+                                   f"its input for {timeout}s")
+            except OSError as e:
+                # The command exited before reading all its input
+                write_error = e
+
+            # The input is sent, wait for the command without limits
+            channel.settimeout(None)
+            channel.status_event.wait()
+
+            for reader in readers:
+                reader.join(timeout=timeout)
+
+            exited = channel.recv_exit_status()
+
+            if exited != 0 or write_error is not None:
+
+                reason = b"".join(stderr).decode(errors="replace").strip()
+
+                if reason == "" and write_error is not None:
+                    reason = str(write_error)
+
+                raise RuntimeError(f"Command '{cmd}' failed in '{node_info.ip}' "
+                                   f"(exit={exited})" + (f": {reason}" if reason else ""))
+        finally:
+            channel.close()
+
+    return b"".join(stdout).decode(errors="replace")
+
+
+def put_files_tar(node_info: ssh.NodeConnectionInfo,
+                  files: Iterable[Tuple[str, str]],
+                  remote_dir_expr: str,
+                  phase: str = None) -> None:
+
+    # A single tar stream of many small files costs one round trip, the
+    # modification times are kept with whole seconds resolution. Symbolic links
+    # are sent as the files they point to.
+    def write(writer: ChannelWriter) -> None:
+
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT,
+                          bufsize=STREAM_BLOCK_SIZE, dereference=True) as tar:
+
+            for local, arcname in files:
+                tar.add(name=local, arcname=arcname, recursive=False)
+
+    _ = run_with_input(node_info=node_info,
+                       cmd=f"mkdir -p {remote_dir_expr} && tar xf - -C {remote_dir_expr}",
+                       write=write,
+                       phase=phase)
@@ -0,0 +1,17 @@
+import importlib
+from typing import Any, Callable, List
+
+
+def lazy_submodules(package: str, submodules: List[str]) -> Callable[[str], Any]:
+
+    # Module-level __getattr__ (PEP 562) importing the submodules only when they
+    # are accessed the first time, so that the CLI does not pay for what it
+    # does not use
+    def __getattr__(name: str) -> Any:
+
+        if name in submodules:
+            return importlib.import_module(f"{package}.{name}")
+
+        raise AttributeError(f"module '{package}' has no attribute '{name}'")
+
+    return __getattr__
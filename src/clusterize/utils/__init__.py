@@ -1,2 +1,5 @@
-from . import docker
-from . import project
+from clusterize.lazy import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ["config", "docker", "inventory", "placement",
+                                         "project", "report", "state",
+                                         "sync", "tracing"])
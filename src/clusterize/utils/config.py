@@ -0,0 +1,113 @@
+import os
+import copy
+import pickle
+import hashlib
+import threading
+from pathlib import Path
+from dataclasses import fields, is_dataclass
+from typing import Any, Dict, Type
+
+CONFIG_CACHE_DIR = "configs"
+
+# Configurations already parsed by this process, keyed by content digest
+_loaded: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def user_cache_dir() -> Path:
+
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    cache_home = Path(cache_home) if cache_home != "" else Path.home() / ".cache"
+
+    return cache_home / "clusterize"
+
+
+def class_layout(cls: Any) -> str:
+
+    # Fields and types of the nested dataclasses too (e.g. Cluster.auth), also when
+    # they are wrapped in generics (e.g. List[Auth])
+    if is_dataclass(cls):
+        return f"{cls.__module__}.{cls.__qualname__}(" + \
+            ", ".join(f"{f.name}: {class_layout(f.type)}" for f in fields(cls)) + ")"
+
+    args = getattr(cls, "__args__", None)
+
+    if args:
+        return f"{getattr(cls, '__origin__', cls)}[" + \
+            ", ".join(class_layout(arg) for arg in args) + "]"
+
+    return repr(cls)
+
+
+def config_digest(data: bytes, cls: Type) -> str:
+
+    digest = hashlib.sha256(data)
+
+    # Objects pickled with a different layout of the class must not be reused
+    digest.update(class_layout(cls).encode())
+
+    return digest.hexdigest()
+
+
+def load_pickled(path: Path, cls: Type) -> Any:
+
+    try:
+        with open(file=path, mode='rb') as f:
+            obj = pickle.load(f)
+    except Exception:
+        # A corrupted or outdated cache is just a cold cache
+        return None
+
+    return obj if isinstance(obj, cls) else None
+
+
+def store_pickled(path: Path, obj: Any) -> None:
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+
+        with open(file=tmp, mode='wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_yaml(path: str, cls: Type, use_cache: bool = True) -> Any:
+
+    data = Path(path).expanduser().read_bytes()
+    digest = config_digest(data=data, cls=cls)
+
+    with _lock:
+        obj = _loaded.get(digest, None)
+
+    if obj is None:
+
+        pickled = user_cache_dir() / CONFIG_CACHE_DIR / f"{digest}.pickle"
+        obj = load_pickled(path=pickled, cls=cls) if use_cache else None
+
+        if obj is None:
+            obj = cls.from_yaml(data.decode())
+
+            if use_cache:
+                store_pickled(path=pickled, obj=obj)
+
+        with _lock:
+            _loaded[digest] = obj
+
+    # Callers are free to modify the returned configuration
+    return copy.deepcopy(obj)
+
+
+def load_cluster(path: str, use_cache: bool = True) -> "structures.cluster.Cluster":
+
+    from clusterize import structures
+    return load_yaml(path=path, cls=structures.cluster.Cluster, use_cache=use_cache)
+
+
+def load_project(path: str, use_cache: bool = True) -> "structures.project.Project":
+
+    from clusterize import structures
+    return load_yaml(path=path, cls=structures.project.Project, use_cache=use_cache)
@@ -1,4 +1,7 @@
+import shlex
+from typing import Dict, List, Optional
 from clusterize import structures
+from clusterize.utils import sync
 
 
 def get_container_name(cluster: structures.cluster.Cluster,
@@ -16,8 +19,81 @@ def wrap_in_docker(cmd: str, container_name: str) -> str:
     return f"docker exec -t {container_name} /bin/sh -c '{cmd}'"
 
 
+def head_image(docker: structures.cluster.Docker) -> str:
+
+    return docker.head_image if docker.head_image else docker.image
+
+
+def worker_image(docker: structures.cluster.Docker) -> str:
+
+    return docker.worker_image if docker.worker_image else docker.image
+
+
+def pinned_digest(image: str) -> Optional[str]:
+
+    # Images referenced as 'repo@sha256:...' do not need to query the registry
+    return image.split("@", 1)[1] if "@" in image else None
+
+
+def registry_digest_cmd(image: str) -> str:
+
+    return f"docker buildx imagetools inspect --format '{{{{.Manifest.Digest}}}}' " \
+           f"{shlex.quote(image)}"
+
+
+def local_digests_cmd(image: str) -> str:
+
+    # Missing images print nothing instead of failing
+    return f"docker image inspect --format '{{{{join .RepoDigests \" \"}}}}' " \
+           f"{shlex.quote(image)} 2>/dev/null || true"
+
+
+def is_image_fresh(local_digests: List[str], digest: Optional[str]) -> bool:
+
+    # Without a wanted digest a local image cannot be trusted to be up to date
+    if digest is None:
+        return False
+
+    return any(d.endswith(f"@{digest}") for d in local_digests)
+
+
+def pull_cmd(image: str, digest: str = None) -> str:
+
+    img = shlex.quote(image)
+
+    pull = f"docker pull {img} && " \
+           f"docker image inspect --format 'Pulled {image} ({{{{.Size}}}} bytes)' {img}"
+
+    if digest is None:
+        return pull
+
+    # The node checks its own copy and pulls only when it is stale. The whole
+    # command is grouped so that chaining it with && keeps the exit code of the pull.
+    return f"{{ ( {local_digests_cmd(image=image)} ) | " \
+           f"grep -q -F {shlex.quote('@' + digest)} " \
+           f"&& echo 'Image {image} up to date ({digest})' || {{ {pull}; }}; }}"
+
+
+def file_mounts_run_options(file_mounts: Dict[str, str]) -> str:
+
+    # The file mounts synced to the nodes are found in the containers at the same
+    # absolute path of the host (~ is the home of the user in the host)
+    volumes = []
+
+    for remote in file_mounts:
+        path = sync.remote_path_expr(path=remote.rstrip("/"))
+        volumes.append(f"-v {path}:{path}")
+
+    return " ".join(volumes)
+
+
 from copy import deepcopy
-def dockerize_cluster(cluster: structures.cluster.Cluster) -> structures.cluster.Cluster:
+def dockerize_cluster(cluster: structures.cluster.Cluster,
+                      distribute_image: bool = False,
+                      image_digests: Dict[str, str] = None,
+                      session: str = None,
+                      cpus: int = None,
+                      gpus: int = None) -> structures.cluster.Cluster:
 
     dockerized_cluster = deepcopy(cluster)
 
@@ -26,13 +102,19 @@ def dockerize_cluster(cluster: structures.cluster.Cluster) -> structures.cluster
 
     # Get the docker images to use
     docker = cluster.docker
-    head_img = docker.image if docker.head_image == "" else docker.head_image
-    worker_img = docker.image if docker.worker_image == "" else docker.worker_image
+    head_img = head_image(docker=docker)
+    worker_img = worker_image(docker=docker)
+
+    # Digests of the images that the nodes should have, when known
+    image_digests = image_digests if image_digests is not None else {}
 
     # Name of the docker containers
     cname = cluster.docker.container_name if cluster.docker.container_name != "" \
         else cluster.cluster_name
 
+    # Volumes of the file mounts synced to the nodes
+    mounts = file_mounts_run_options(file_mounts=cluster.file_mounts)
+
     # Initialize the deployed cluster configuration and ssh key file names
     cluster_ssh_key = "cluster_ssh_key.pem"
     cluster_bootstrap = "cluster_bootstrap.yaml"
@@ -46,20 +128,27 @@ def dockerize_cluster(cluster: structures.cluster.Cluster) -> structures.cluster
 
     head_setup_commands = []
 
-    # Pull the image if asked
-    if cluster.docker.pull_before_run:
-        head_setup_commands.append(f"docker pull {docker.head_image}")
+    # Pull the image if asked, unless it gets distributed by the head
+    if cluster.docker.pull_before_run and not distribute_image:
+        head_setup_commands.append(pull_cmd(image=head_img,
+                                            digest=image_digests.get(head_img, None)))
 
     # Start building the "docker run" command line
     head_extra_run_options = " ".join(docker.run_options + docker.head_run_options)
 
     # Note that the cluster and project names are forced to match
     labels = f"-l clusterize " \
-             f"-l clusterize.project={cluster.cluster_name}"
+             f"-l clusterize.project={cluster.cluster_name} " \
+             f"-l clusterize.session={session if session else cname}"
+
+    # Resources reserved in every node, used to place the other sessions
+    if cpus is not None or gpus is not None:
+        labels += f" -l clusterize.cpus={cpus or 0} -l clusterize.gpus={gpus or 0}"
 
     docker_run = f"docker run -t --rm -d --name {cname} {labels} --net host " \
                  f"-v ~/{cluster_bootstrap}:/{cluster_bootstrap}:ro " \
                  f"-v ~/{cluster_ssh_key}:/{cluster_ssh_key}:ro " \
+                 f"{mounts} " \
                  f"-e LC_ALL=C.UTF-8 -e LANG=C.UTF-8 " \
                  f"{head_extra_run_options} " \
                  f"{head_img} bash"
@@ -79,20 +168,27 @@ def dockerize_cluster(cluster: structures.cluster.Cluster) -> structures.cluster
 
     worker_setup_commands = []
 
-    # Pull the image if asked
-    if dockerized_cluster.docker.pull_before_run:
-        worker_setup_commands.append(f"docker pull {docker.worker_image}")
+    # Pull the image if asked, unless it gets distributed by the head
+    if dockerized_cluster.docker.pull_before_run and not distribute_image:
+        worker_setup_commands.append(pull_cmd(image=worker_img,
+                                              digest=image_digests.get(worker_img, None)))
 
     # Start building the "docker run" command line
     worker_extra_run_options = " ".join(docker.run_options + docker.worker_run_options)
 
     # Note that the cluster and project names are forced to match
     labels = f"-l clusterize " \
-             f"-l clusterize.project={cluster.cluster_name}"
+             f"-l clusterize.project={cluster.cluster_name} " \
+             f"-l clusterize.session={session if session else cname}"
+
+    # Resources reserved in every node, used to place the other sessions
+    if cpus is not None or gpus is not None:
+        labels += f" -l clusterize.cpus={cpus or 0} -l clusterize.gpus={gpus or 0}"
 
     docker_run = f"docker run -t --rm -d --name {cname} {labels} --net host " \
                  f"-v ~/{cluster_bootstrap}:/{cluster_bootstrap}:ro " \
                  f"-v ~/{cluster_ssh_key}:/{cluster_ssh_key}:ro " \
+                 f"{mounts} " \
                  f"-e LC_ALL=C.UTF-8 -e LANG=C.UTF-8 " \
                  f"-e RAY_HEAD_IP={cluster.provider.head_ip} " \
                  f"{worker_extra_run_options} " \
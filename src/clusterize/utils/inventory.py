@@ -0,0 +1,89 @@
+import os
+import json
+import time
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+INVENTORY_FILE = ".clusterize_inventory.json"
+DEFAULT_TTL = 24 * 3600.0
+
+
+@dataclass
+class InventoryEntry:
+
+    timestamp: float
+    boot_id: str
+    info: Dict[str, Any]
+
+
+class Inventory:
+
+    def __init__(self, project_dir: str, ttl: float = DEFAULT_TTL):
+
+        self._ttl = ttl
+        self._path = Path(project_dir).expanduser().absolute() / INVENTORY_FILE
+        self._entries: Dict[str, InventoryEntry] = {}
+
+        self.load()
+
+    def load(self) -> None:
+
+        if not self._path.is_file():
+            return
+
+        try:
+            with open(file=self._path, mode='r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # A corrupted inventory is just a cold cache
+            return
+
+        self._entries = {host: InventoryEntry(**entry) for host, entry in data.items()}
+
+    def save(self) -> None:
+
+        tmp = self._path.with_suffix(".tmp")
+
+        with open(file=tmp, mode='w') as f:
+            json.dump({host: asdict(e) for host, e in self._entries.items()}, f, indent=2)
+
+        os.replace(tmp, self._path)
+
+    def get(self, host: str) -> Optional[InventoryEntry]:
+
+        entry = self._entries.get(host, None)
+
+        if entry is None or time.time() - entry.timestamp > self._ttl:
+            return None
+
+        return entry
+
+    def put(self, host: str, info: Dict[str, Any], boot_id: str = None) -> None:
+
+        self._entries[host] = InventoryEntry(timestamp=time.time(),
+                                             boot_id=boot_id,
+                                             info=info)
+
+    def invalidate(self, host: str) -> None:
+
+        _ = self._entries.pop(host, None)
+
+    def stale_hosts(self,
+                    hosts: List[str],
+                    boot_ids: Dict[str, str] = None) -> List[str]:
+
+        stale = []
+
+        for host in hosts:
+
+            entry = self.get(host=host)
+
+            if entry is None:
+                stale.append(host)
+
+            # A node that rebooted might have changed its resources
+            elif boot_ids is not None and boot_ids.get(host, None) != entry.boot_id:
+                stale.append(host)
+
+        return stale
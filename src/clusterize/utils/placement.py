@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from typing import List
+
+# Resources reserved by the running sessions, stored as labels of their containers
+USAGE_CMD = "docker ps --filter label=clusterize " \
+            "--format '{{.Label \"clusterize.cpus\"}}\t{{.Label \"clusterize.gpus\"}}'"
+
+
+@dataclass
+class NodeLoad:
+
+    ip: str
+    cpus: int
+    gpus: int
+    used_cpus: int = 0
+    used_gpus: int = 0
+
+    @property
+    def free_cpus(self) -> int:
+
+        return max(self.cpus - self.used_cpus, 0)
+
+    @property
+    def free_gpus(self) -> int:
+
+        return max(self.gpus - self.used_gpus, 0)
+
+
+def add_usage(node: NodeLoad, stdout: str) -> None:
+
+    for line in stdout.splitlines():
+
+        cpus, _, gpus = line.partition("\t")
+
+        try:
+            node.used_cpus += int(cpus)
+            node.used_gpus += int(gpus)
+        except ValueError:
+            # Sessions started without a reservation might use the whole node
+            node.used_cpus = node.cpus
+            node.used_gpus = node.gpus
+
+
+def place(nodes: List[NodeLoad],
+          cpus: int = 0,
+          gpus: int = 0,
+          workers: int = None) -> List[str]:
+
+    candidates = [n for n in nodes if n.free_cpus >= cpus and n.free_gpus >= gpus]
+
+    # Prefer the least loaded nodes, keeping the nodes with free GPUs for the
+    # sessions that need them
+    if gpus == 0:
+        candidates.sort(key=lambda n: (n.free_gpus, -n.free_cpus, n.ip))
+    else:
+        candidates.sort(key=lambda n: (-n.free_gpus, -n.free_cpus, n.ip))
+
+    if len(candidates) == 0:
+        raise RuntimeError(f"No worker has {cpus} free CPUs and {gpus} free GPUs")
+
+    if workers is None:
+        workers = len(candidates)
+
+    if len(candidates) < workers:
+        raise RuntimeError(f"Only {len(candidates)} workers have {cpus} free CPUs and "
+                           f"{gpus} free GPUs, {workers} requested")
+
+    return [n.ip for n in candidates[:workers]]
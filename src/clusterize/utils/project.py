@@ -1,7 +1,10 @@
 import os
+import json
 from pathlib import Path
-from clusterize import structures
-from typing import List, NamedTuple, Optional
+from clusterize.utils import config
+from typing import Dict, List, NamedTuple, Optional
+
+PROJECT_INDEX_FILE = "projects.json"
 
 
 class ProjectData(NamedTuple):
@@ -12,27 +15,149 @@ class ProjectData(NamedTuple):
     directory: str
 
 
-def find_projects(folder: str = str(Path.cwd())) -> List[ProjectData]:
+def project_stamp(project_path: Path) -> List[List[int]]:
 
-    found_projects = []
+    stamp = []
 
-    for f in os.listdir(folder):
+    # The parsed data is valid as long as the files did not change
+    for name in ("cluster.yaml", "project.yaml"):
+        stat = os.stat(project_path / name)
+        stamp.append([stat.st_mtime_ns, stat.st_size])
 
-        project_path = Path(f).expanduser().absolute()
+    return stamp
 
-        if (project_path / ".clusterize").exists():
 
-            project_data = get_project_data(project_folder=str(project_path))
+class ProjectIndex:
 
-            if project_data is None:
-                raise RuntimeError(f"Project folder {str(project_path)} is malformed")
+    def __init__(self, path: Path = None):
 
-            found_projects.append(project_data)
+        self._path = path if path is not None else config.user_cache_dir() / PROJECT_INDEX_FILE
+        self._entries: Dict[str, Dict] = {}
+        self._changed = False
 
-    return found_projects
+        self.load()
 
+    def load(self) -> None:
 
-def get_project_data(project_folder: str = str(Path.cwd())) -> Optional[ProjectData]:
+        if not self._path.is_file():
+            return
+
+        try:
+            with open(file=self._path, mode='r') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            # A corrupted index is just a cold cache
+            return
+
+    def save(self) -> None:
+
+        if not self._changed:
+            return
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+
+        with open(file=tmp, mode='w') as f:
+            json.dump(self._entries, f)
+
+        os.replace(tmp, self._path)
+        self._changed = False
+
+    def get(self, project_path: Path) -> Optional[ProjectData]:
+
+        entry = self._entries.get(str(project_path), None)
+
+        try:
+            if entry is None or entry["stamp"] != project_stamp(project_path=project_path):
+                return None
+        except OSError:
+            return None
+
+        return ProjectData(**entry["data"])
+
+    def put(self, project_data: ProjectData) -> None:
+
+        project_path = Path(project_data.directory)
+
+        self._entries[str(project_path)] = dict(
+            stamp=project_stamp(project_path=project_path),
+            data=project_data._asdict())
+
+        self._changed = True
+
+
+def scan_project_dirs(folder: str, recursive: bool = False) -> List[Path]:
+
+    project_dirs = []
+    pending = [Path(folder).expanduser().absolute()]
+
+    while len(pending) != 0:
+
+        with os.scandir(pending.pop()) as it:
+            entries = sorted(it, key=lambda e: e.name)
+
+        for entry in entries:
+
+            if not entry.is_dir(follow_symlinks=False) or entry.name.startswith("."):
+                continue
+
+            if os.path.exists(os.path.join(entry.path, ".clusterize")):
+                project_dirs.append(Path(entry.path))
+
+            # Projects are not searched inside other projects
+            elif recursive:
+                pending.append(Path(entry.path))
+
+    return sorted(project_dirs)
+
+
+def find_projects(folder: str = str(Path.cwd()),
+                  recursive: bool = False,
+                  max_workers: int = 1,
+                  index: ProjectIndex = None) -> List[ProjectData]:
+
+    index = index if index is not None else ProjectIndex()
+    project_dirs = scan_project_dirs(folder=folder, recursive=recursive)
+
+    found_projects = {path: index.get(project_path=path) for path in project_dirs}
+    missing = [str(path) for path, data in found_projects.items() if data is None]
+
+    # Parsing the yaml files is CPU bound, parse them in separate processes
+    if max_workers > 1 and len(missing) > 1:
+
+        # Importing the process pool is slow, do it only when it is needed
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(get_project_data, missing))
+    else:
+        parsed = [get_project_data(project_folder=path) for path in missing]
+
+    for path, project_data in zip(missing, parsed):
+
+        if project_data is None:
+            raise RuntimeError(f"Project folder {path} is malformed")
+
+        index.put(project_data=project_data)
+        found_projects[Path(path)] = project_data
+
+    try:
+        index.save()
+    except OSError:
+        # The index is only a cache
+        pass
+
+    return [found_projects[path] for path in project_dirs]
+
+
+class ProjectConfig(NamedTuple):
+
+    data: ProjectData
+    cluster: "structures.cluster.Cluster"
+    project: "structures.project.Project"
+
+
+def get_project_config(project_folder: str = str(Path.cwd())) -> Optional[ProjectConfig]:
 
     project_path = Path(project_folder).expanduser().absolute()
 
@@ -45,13 +170,9 @@ def get_project_data(project_folder: str = str(Path.cwd())) -> Optional[ProjectD
     assert cluster_yaml.is_file()
     assert project_yaml.is_file()
 
-    with open(file=cluster_yaml, mode='r') as f:
-        cluster: structures.cluster.Cluster = \
-            structures.cluster.Cluster.from_yaml(data=f)
-
-    with open(file=project_yaml, mode='r') as f:
-        project: structures.project.Project = \
-            structures.project.Project.from_yaml(data=f)
+    # Each file is parsed only once, also across different processes
+    cluster = config.load_cluster(path=str(cluster_yaml))
+    project = config.load_project(path=str(project_yaml))
 
     if project.name != cluster.cluster_name:
         raise RuntimeError(f"Project and cluster name do not match ('{project_path}')")
@@ -61,4 +182,11 @@ def get_project_data(project_folder: str = str(Path.cwd())) -> Optional[ProjectD
                                cluster=str(project_path / "cluster.yaml"),
                                project=str(project_path / "project.yaml"))
 
-    return project_data
+    return ProjectConfig(data=project_data, cluster=cluster, project=project)
+
+
+def get_project_data(project_folder: str = str(Path.cwd())) -> Optional[ProjectData]:
+
+    project_config = get_project_config(project_folder=project_folder)
+
+    return project_config.data if project_config is not None else None
@@ -0,0 +1,32 @@
+import statistics
+from typing import Dict
+from clusterize.executors import base
+
+
+def print_outcomes(outcomes: Dict[str, base.HostOutcome],
+                   straggler_factor: float = base.DEFAULT_STRAGGLER_FACTOR) -> None:
+
+    if len(outcomes) == 0:
+        return
+
+    median = statistics.median(o.elapsed for o in outcomes.values())
+    stragglers = base.stragglers(outcomes=outcomes, factor=straggler_factor)
+
+    for host, outcome in outcomes.items():
+
+        attempts = f" after {outcome.attempts} attempts" if outcome.attempts > 1 else ""
+
+        if outcome.timed_out:
+            print(f"[{host}] timed out{attempts}")
+
+        elif outcome.exception is not None:
+            print(f"[{host}] failed{attempts}: {outcome.exception}")
+
+        elif outcome.failed:
+            print(f"[{host}] exited with code {outcome.result.exited}{attempts}")
+
+        elif outcome.attempts > 1:
+            print(f"[{host}] succeeded{attempts}")
+
+        elif host in stragglers:
+            print(f"[{host}] straggler: {outcome.elapsed:.2f}s (median {median:.2f}s)")
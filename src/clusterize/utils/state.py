@@ -0,0 +1,140 @@
+import os
+import json
+import shlex
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+STATE_FILE = ".clusterize_state.json"
+REMOTE_STATE_DIR = ".clusterize_state"
+
+
+def phase_hash(commands: List[str], previous: str = "") -> str:
+
+    # Chaining the hash of the previous phase invalidates all the following
+    # phases when any of the commands change
+    digest = hashlib.sha256(previous.encode())
+
+    for cmd in commands:
+        digest.update(b"\0" + cmd.encode())
+
+    return digest.hexdigest()
+
+
+def remote_state_dir(session: str = None) -> str:
+
+    if session is None:
+        return f"~/{REMOTE_STATE_DIR}"
+
+    return f"~/{REMOTE_STATE_DIR}/{shlex.quote(session)}"
+
+
+def mark_phase_cmd(session: str, phase: str, digest: str) -> str:
+
+    state_dir = remote_state_dir(session=session)
+
+    return f"mkdir -p {state_dir} && printf '%s %s\\n' {digest} " \
+           f"\"$(cat /proc/sys/kernel/random/boot_id)\" > {state_dir}/{phase}"
+
+
+def read_phases_cmd(session: str) -> str:
+
+    state_dir = remote_state_dir(session=session)
+
+    return f"echo \"boot_id $(cat /proc/sys/kernel/random/boot_id)\"; " \
+           f"for f in {state_dir}/*; do [ -f \"$f\" ] && " \
+           f"echo \"$(basename \"$f\") $(cat \"$f\")\"; done; true"
+
+
+def clear_phases_cmd(session: str = None) -> str:
+
+    return f"rm -rf {remote_state_dir(session=session)}"
+
+
+def parse_phases(stdout: str) -> Dict[str, str]:
+
+    boot_id = None
+    phases = {}
+
+    for line in stdout.splitlines():
+
+        fields = line.split()
+
+        if len(fields) == 2 and fields[0] == "boot_id":
+            boot_id = fields[1]
+
+        # A phase completed before a reboot left nothing running behind
+        elif len(fields) == 3 and fields[2] == boot_id:
+            phases[fields[0]] = fields[1]
+
+    return phases
+
+
+class StartState:
+
+    def __init__(self, project_dir: str, session: str = None):
+
+        self._lock = threading.Lock()
+        self._session = session
+        self._path = Path(project_dir).expanduser().absolute() / STATE_FILE
+        self._sessions: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._node_phases: Dict[str, Dict[str, str]] = {}
+
+        self.load()
+
+    @property
+    def session(self) -> str:
+
+        return self._session
+
+    def load(self) -> None:
+
+        if not self._path.is_file():
+            return
+
+        try:
+            with open(file=self._path, mode='r') as f:
+                self._sessions = json.load(f)
+        except (OSError, ValueError):
+            # A corrupted state just means starting from scratch
+            return
+
+    def save(self) -> None:
+
+        tmp = self._path.with_suffix(".tmp")
+
+        with self._lock:
+            with open(file=tmp, mode='w') as f:
+                json.dump(self._sessions, f, indent=2)
+
+            os.replace(tmp, self._path)
+
+    def set_node_phases(self, host: str, stdout: str) -> None:
+
+        self._node_phases[host] = parse_phases(stdout=stdout)
+
+    def completed(self, host: str, phase: str, digest: str) -> bool:
+
+        hosts = self._sessions.get(self._session, {})
+
+        # The phase must be recorded both locally and in the node since its last boot
+        return hosts.get(host, {}).get(phase, None) == digest and \
+            self._node_phases.get(host, {}).get(phase, None) == digest
+
+    def record(self, host: str, phase: str, digest: str) -> None:
+
+        with self._lock:
+            hosts = self._sessions.setdefault(self._session, {})
+            hosts.setdefault(host, {})[phase] = digest
+
+    def invalidate(self) -> None:
+
+        with self._lock:
+
+            if self._session is None:
+                self._sessions.clear()
+            else:
+                _ = self._sessions.pop(self._session, None)
+
+            self._node_phases.clear()
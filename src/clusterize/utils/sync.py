@@ -0,0 +1,315 @@
+import os
+import json
+import shlex
+import hashlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+from dataclasses import dataclass, field
+from clusterize.utils import config
+
+# Manifests of the synced files, stored in the nodes next to the ssh key
+REMOTE_MANIFEST_DIR = ".clusterize_sync"
+
+HASH_CACHE_FILE = "sync_hashes.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Separates the state of the different mounts in the output of the nodes
+MOUNT_MARKER = "### mount "
+LIST_MARKER = "### files"
+
+
+class FileEntry(NamedTuple):
+
+    sha256: str
+    size: int
+    # Whole seconds, the resolution preserved by the transfer
+    mtime: int
+
+
+@dataclass
+class Mount:
+
+    remote: str
+    local: Path
+    # Single files are synced in the remote parent directory
+    is_file: bool = False
+
+    @property
+    def remote_dir(self) -> str:
+
+        return os.path.dirname(self.remote) if self.is_file else self.remote
+
+    @property
+    def manifest_name(self) -> str:
+
+        return hashlib.sha256(self.remote.encode()).hexdigest()[:16]
+
+
+@dataclass
+class MountPlan:
+
+    mount: Mount
+    send: List[str] = field(default_factory=list)
+    delete: List[str] = field(default_factory=list)
+    manifest: Dict[str, FileEntry] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+
+        return len(self.send) != 0 or len(self.delete) != 0
+
+
+def get_mounts(file_mounts: Dict[str, str], project_dir: str) -> List[Mount]:
+
+    mounts = []
+
+    # Like in ray, file_mounts maps the remote paths to the local paths, here
+    # relative to the project
+    for remote, local in file_mounts.items():
+
+        local_path = Path(project_dir, Path(local).expanduser()).absolute()
+
+        if not local_path.exists():
+            raise RuntimeError(f"File mount '{local}' not found")
+
+        mounts.append(Mount(remote=remote.rstrip("/"),
+                            local=local_path,
+                            is_file=local_path.is_file()))
+
+    return mounts
+
+
+def remote_path_expr(path: str) -> str:
+
+    # Paths relative to the home are expanded by the remote shell
+    if path == "~":
+        return '"$HOME"'
+
+    if path.startswith("~/"):
+        return f'"$HOME"/{shlex.quote(path[2:])}'
+
+    return shlex.quote(path)
+
+
+def remote_manifest_path_expr(mount: Mount) -> str:
+
+    return f'"$HOME"/{REMOTE_MANIFEST_DIR}/{mount.manifest_name}'
+
+
+class HashCache:
+
+    def __init__(self, path: Path = None):
+
+        if path is None:
+            path = config.user_cache_dir() / HASH_CACHE_FILE
+
+        self.path = path
+
+        try:
+            self._hashes: Dict[str, List] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self._hashes = {}
+
+        self._dirty = False
+
+    def sha256(self, path: Path, stat: os.stat_result) -> str:
+
+        key = str(path)
+        cached = self._hashes.get(key, None)
+
+        # Files are hashed again only if their size or modification time changed
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+
+        digest = hashlib.sha256()
+
+        with open(file=path, mode='rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+
+        self._hashes[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._dirty = True
+
+        return digest.hexdigest()
+
+    def save(self) -> None:
+
+        if not self._dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._hashes))
+        tmp.replace(self.path)
+
+        self._dirty = False
+
+
+def walk_files(root: Path) -> List[Tuple[str, Path]]:
+
+    files = []
+    pending = [root]
+
+    # Symbolic links to files and directories are both followed, and the nodes
+    # receive what they point to. Directories reached twice (loops) are skipped.
+    visited = {os.path.realpath(root)}
+
+    while len(pending) != 0:
+
+        with os.scandir(pending.pop()) as entries:
+
+            for entry in entries:
+
+                if entry.is_dir():
+
+                    target = os.path.realpath(entry.path)
+
+                    if target in visited:
+                        print(f"Skipping '{entry.path}', directory '{target}' "
+                              f"is already synced")
+                        continue
+
+                    visited.add(target)
+                    pending.append(Path(entry.path))
+
+                elif entry.is_file():
+                    rel = os.path.relpath(entry.path, root)
+
+                    # Lines of the manifests cannot store these names
+                    if "\n" in rel or "\t" in rel:
+                        continue
+
+                    files.append((rel, Path(entry.path)))
+
+    return files
+
+
+def local_manifest(mount: Mount, cache: HashCache) -> Dict[str, FileEntry]:
+
+    if mount.is_file:
+        files = [(os.path.basename(mount.remote), mount.local)]
+    else:
+        files = walk_files(root=mount.local)
+
+    manifest = {}
+
+    for rel, path in files:
+
+        stat = path.stat()
+        manifest[rel] = FileEntry(sha256=cache.sha256(path=path, stat=stat),
+                                  size=stat.st_size,
+                                  mtime=int(stat.st_mtime))
+
+    return manifest
+
+
+def remote_state_cmd(mounts: List[Mount]) -> str:
+
+    cmds = []
+
+    # For every mount, the manifest of the last sync and the current size and
+    # modification time of the files listed in it
+    for mount in mounts:
+
+        manifest = remote_manifest_path_expr(mount=mount)
+        cmds.append(f"echo {shlex.quote(MOUNT_MARKER + mount.manifest_name)}; "
+                    f"cat {manifest} 2>/dev/null; "
+                    f"echo {shlex.quote(LIST_MARKER)}; "
+                    f"( cd {remote_path_expr(mount.remote_dir)} && "
+                    f"cut -f4 {manifest} | tr '\\n' '\\0' | "
+                    f"xargs -0 -r stat -c '%s\t%Y\t%n' -- ) 2>/dev/null")
+
+    return "; ".join(cmds) + "; true"
+
+
+def parse_manifest(lines: List[str]) -> Dict[str, FileEntry]:
+
+    manifest = {}
+
+    for line in lines:
+
+        fields = line.split("\t", 3)
+
+        if len(fields) != 4:
+            continue
+
+        sha256, size, mtime, rel = fields
+
+        try:
+            manifest[rel] = FileEntry(sha256=sha256, size=int(size), mtime=int(mtime))
+        except ValueError:
+            pass
+
+    return manifest
+
+
+def parse_remote_state(stdout: str) \
+        -> Dict[str, Tuple[Dict[str, FileEntry], Dict[str, Tuple[int, int]]]]:
+
+    state = {}
+    name, section = None, None
+
+    for line in stdout.splitlines():
+
+        if line.startswith(MOUNT_MARKER):
+            name = line[len(MOUNT_MARKER):]
+            state[name] = ([], [])
+            section = 0
+            continue
+
+        if line == LIST_MARKER:
+            section = 1
+            continue
+
+        if name is not None:
+            state[name][section].append(line)
+
+    parsed = {}
+
+    for name, (manifest_lines, stat_lines) in state.items():
+
+        stats = {}
+
+        for line in stat_lines:
+
+            fields = line.split("\t", 2)
+
+            if len(fields) == 3 and fields[0].isdigit() and fields[1].isdigit():
+                stats[fields[2]] = (int(fields[0]), int(fields[1]))
+
+        parsed[name] = (parse_manifest(lines=manifest_lines), stats)
+
+    return parsed
+
+
+def plan_mount(mount: Mount,
+               local: Dict[str, FileEntry],
+               remote_manifest: Dict[str, FileEntry],
+               remote_stats: Dict[str, Tuple[int, int]]) -> MountPlan:
+
+    plan = MountPlan(mount=mount)
+
+    for rel, entry in local.items():
+
+        synced = remote_manifest.get(rel, None)
+
+        # The node has the same content only if it was synced with the same hash
+        # and nobody changed the file since then
+        if synced is not None and synced.sha256 == entry.sha256 and \
+                remote_stats.get(rel, None) == (synced.size, synced.mtime):
+            plan.manifest[rel] = synced
+        else:
+            plan.send.append(rel)
+            plan.manifest[rel] = entry
+
+    # Only the files synced before are removed, never the files of other origins
+    plan.delete = sorted(rel for rel in remote_manifest if rel not in local)
+
+    return plan
+
+
+def manifest_data(manifest: Dict[str, FileEntry]) -> bytes:
+
+    return "".join(f"{e.sha256}\t{e.size}\t{e.mtime}\t{rel}\n"
+                   for rel, e in sorted(manifest.items())).encode()
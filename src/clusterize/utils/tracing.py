@@ -0,0 +1,172 @@
+import json
+import time
+import threading
+import contextlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_SUMMARY_SIZE = 5
+
+
+@dataclass
+class Span:
+
+    name: str
+    category: str
+    start: float
+    duration: float = 0.0
+    host: str = None
+    phase: str = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+
+    def __init__(self):
+
+        self.enabled = False
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans: List[Span] = []
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+
+        with self._lock:
+            self._spans.clear()
+            self._origin = time.perf_counter()
+            self.enabled = True
+
+    def disable(self) -> None:
+
+        self.enabled = False
+
+    @property
+    def phase(self) -> Optional[str]:
+
+        return getattr(self._local, "phase", None)
+
+    @contextlib.contextmanager
+    def in_phase(self, phase: str) -> Iterator[None]:
+
+        # The phase is per thread, the thread pools of the executors get it
+        # explicitly from the thread submitting the work
+        previous = self.phase
+        self._local.phase = phase
+
+        try:
+            yield
+        finally:
+            self._local.phase = previous
+
+    @contextlib.contextmanager
+    def span(self,
+             name: str,
+             category: str,
+             host: str = None,
+             phase: str = None,
+             **args) -> Iterator[Optional[Span]]:
+
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name=name,
+                    category=category,
+                    start=time.perf_counter() - self._origin,
+                    host=host,
+                    phase=phase if phase is not None else self.phase,
+                    args=args)
+
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - self._origin - span.start
+
+            with self._lock:
+                self._spans.append(span)
+
+    @contextlib.contextmanager
+    def phase_span(self, phase: str, host: str = None, **args) -> Iterator[None]:
+
+        with self.in_phase(phase=phase), self.span(name=phase, category="phase",
+                                                   host=host, **args):
+            yield
+
+    def spans(self) -> List[Span]:
+
+        with self._lock:
+            return list(self._spans)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+
+        spans = self.spans()
+
+        # Every node gets its own track, the client operations go in the first one
+        hosts = sorted({s.host for s in spans if s.host is not None})
+        tids = {host: idx + 1 for idx, host in enumerate(hosts)}
+
+        events = [dict(name="thread_name", ph="M", pid=1, tid=0, args=dict(name="client"))]
+        events += [dict(name="thread_name", ph="M", pid=1, tid=tid, args=dict(name=host))
+                   for host, tid in tids.items()]
+
+        for s in spans:
+            events.append(dict(name=s.name,
+                               cat=s.category,
+                               ph="X",
+                               ts=s.start * 1e6,
+                               dur=s.duration * 1e6,
+                               pid=1,
+                               tid=tids.get(s.host, 0),
+                               args=dict(s.args, host=s.host, phase=s.phase)))
+
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save(self, path: str) -> None:
+
+        with open(file=path, mode='w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self, size: int = DEFAULT_SUMMARY_SIZE) -> List[str]:
+
+        spans = [s for s in self.spans() if s.host is not None]
+
+        busy: Dict[str, float] = {}
+
+        for s in spans:
+            busy[s.host] = busy.get(s.host, 0.0) + s.duration
+
+        lines = ["Slowest nodes:"]
+        lines += [f"  {host}: {duration:.2f}s"
+                  for host, duration in sorted(busy.items(), key=lambda i: -i[1])[:size]]
+
+        lines += ["Slowest operations:"]
+        lines += [f"  {s.duration:.2f}s [{s.host}] {s.phase or '-'} {s.name}: "
+                  f"{s.args.get('cmd', s.args.get('remote', ''))[:80]}"
+                  for s in sorted(spans, key=lambda s: -s.duration)[:size]]
+
+        return lines
+
+
+# Spans are collected by all the modules of the same CLI invocation
+tracer = Tracer()
+
+
+@contextlib.contextmanager
+def tracing(path: str = None) -> Iterator[None]:
+
+    if path is None:
+        yield
+        return
+
+    tracer.enable()
+
+    try:
+        yield
+    finally:
+        tracer.disable()
+        tracer.save(path=path)
+
+        print("\n".join(tracer.summary()))
+        print(f"Trace stored in '{path}'")